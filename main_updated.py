@@ -10,12 +10,1683 @@ from datetime import datetime
 import os
 import platform
 import json
+import base64
+import hashlib
+import pickle
+import re
+import math
+import time
+import sys
+import zlib
+import argparse
+import struct
+import threading
+import urllib.request
+from collections import namedtuple
+import heapq
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
 
 # Create folders if they don't exist
 for folder in ['data', 'receipts_in', 'receipts_out']:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
+# --- Warm-start snapshot ---
+SNAPSHOT_FILE = os.path.join('data', 'state_snapshot.bin')
+SNAPSHOT_VERSION = 6
+SNAPSHOT_INTERVAL_MS = 5 * 60 * 1000  # checkpoint ทุก 5 นาทีถ้ามีการเปลี่ยนแปลง
+HISTORY_PAGE_SIZE = 500  # จำนวนแถวล่าสุดที่แสดงในแต่ละตาราง
+
+
+def file_fingerprint(path):
+    """คืนค่า (ขนาด, mtime_ns, sha256) ของไฟล์ หรือ None ถ้าไม่มีไฟล์"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return (st.st_size, st.st_mtime_ns, digest.hexdigest())
+
+
+def _stat_key(path):
+    """(ขนาด, mtime_ns) ของไฟล์ หรือ None ถ้าไม่มีไฟล์"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def fingerprint_matches(path, fingerprint):
+    """ตรวจว่าไฟล์ยังตรงกับ fingerprint เดิม (ขนาด/เวลาแก้ไขก่อน แล้วจึงเทียบ hash)"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return fingerprint is None
+    if fingerprint is None or st.st_size != fingerprint[0]:
+        return False
+    if st.st_mtime_ns == fingerprint[1]:
+        return True
+    # เวลาแก้ไขเปลี่ยนแต่ขนาดเท่าเดิม (เช่น ถูก copy/touch) ให้เทียบเนื้อหา
+    current = file_fingerprint(path)
+    return current is not None and current[2] == fingerprint[2]
+
+
+def read_ledger_rows(excel_file):
+    """อ่านแถวข้อมูลทั้งหมดจากไฟล์ Excel (ข้ามหัวตารางและแถวว่าง)"""
+    if not os.path.exists(excel_file):
+        return []
+    wb = load_workbook(excel_file, read_only=True)
+    try:
+        ws = wb.active
+        return [tuple(row[:7]) for row in ws.iter_rows(min_row=2, values_only=True)
+                if row[0] is not None]
+    finally:
+        wb.close()
+
+
+# ลำดับการค้นหาไฟล์ฟอนต์
+THAI_FONT_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "TH Sarabun New Bold.ttf"),
+    os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "THSarabunNew Bold.ttf"),
+    os.path.join(os.path.dirname(os.path.abspath(
+        __file__)), "fonts", "TH Sarabun New Bold.ttf"),
+    "C:/Windows/Fonts/THSarabunNew Bold.ttf",
+    "C:/Windows/Fonts/TH Sarabun New Bold.ttf",
+    "/usr/share/fonts/truetype/thai/TH Sarabun New Bold.ttf",
+    "/usr/local/share/fonts/TH Sarabun New Bold.ttf",
+    "/System/Library/Fonts/TH Sarabun New Bold.ttf",
+    "/Library/Fonts/TH Sarabun New Bold.ttf"
+]
+
+# ข้อมูลรายการที่ฝังไว้ใน Keywords ของ PDF เพื่อให้ตรวจสอบย้อนกลับได้
+RECEIPT_META_PREFIX = 'scrapshop:'
+
+
+def normalize_receipt_path(path):
+    """ทำให้ path ใบเสร็จเทียบกันได้ทุกระบบ (เช่น receipts_in\\x.pdf กับ receipts_in/x.pdf)"""
+    return os.path.normpath(str(path).replace('\\', '/')).replace(os.sep, '/')
+
+
+DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_timestamp(value):
+    """แปลงวันที่ในสมุดบัญชีเป็นวินาทีนับจาก epoch (ไม่อิงโซนเวลา) หรือ None ถ้าแปลงไม่ได้"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        for fmt in (DATE_FORMAT, '%d/%m/%Y'):
+            try:
+                dt = datetime.strptime(str(value), fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    return (dt - _EPOCH).total_seconds()
+
+
+def format_timestamp(ts):
+    return (_EPOCH + timedelta(seconds=ts)).strftime(DATE_FORMAT)
+
+
+LEDGER_HEADER = ["วันที่", "ชื่อผู้ขาย/ผู้จ่าย", "ชื่อผู้รับ",
+                 "สินค้า", "ราคา/กก.", "น้ำหนัก (กก.)", "รวม (บาท)"]
+
+
+def create_ledger_file(excel_file, rows=()):
+    """สร้างไฟล์ Excel ใหม่พร้อมหัวตาราง (และแถวข้อมูลถ้ามี)"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Records"
+    ws.append(LEDGER_HEADER)
+    for row in rows:
+        ws.append(tuple(row))
+    wb.save(excel_file)
+
+
+def append_ledger_rows(excel_file, rows):
+    """เพิ่มหลายแถวต่อท้ายไฟล์ Excel ในการบันทึกครั้งเดียว"""
+    if not os.path.exists(excel_file):
+        create_ledger_file(excel_file)
+    wb = load_workbook(excel_file)
+    ws = wb.active
+    for row in rows:
+        ws.append(tuple(row))
+    wb.save(excel_file)
+
+
+def append_receipt_history(history_file, mode, record):
+    """เพิ่มหนึ่งรายการในประวัติใบเสร็จ (สร้างไฟล์ใหม่ถ้ายังไม่มีหรืออ่านไม่ได้)"""
+    history = {'in': [], 'out': []}
+    try:
+        if os.path.exists(history_file):
+            with open(history_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        print("📝 สร้างไฟล์ประวัติใบเสร็จใหม่")
+
+    history.setdefault(mode, []).append(list(record))
+    with open(history_file, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=4)
+
+
+def build_transaction(name1, name2, item, price_per_kg, weight, when=None):
+    """สร้างข้อมูลรายการ (วันที่, ชื่อ1, ชื่อ2, สินค้า, ราคา, น้ำหนัก, รวม)"""
+    total = price_per_kg * weight
+    return ((when or datetime.now()).strftime(DATE_FORMAT),
+            name1, name2, item, price_per_kg, weight, total)
+
+
+def write_receipt_history(history_file, history):
+    """เขียนประวัติใบเสร็จทั้งหมดลงไฟล์ JSON"""
+    tmp_file = f"{history_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, history_file)
+
+
+class RecordStore:
+    """ที่เก็บรายการซื้อขายของโหมดหนึ่งแบบแยกคอลัมน์ ทุกตารางอ้างอิงแถวด้วย row id"""
+
+    LEDGER = 1   # มีแถวในไฟล์ Excel
+    RECEIPT = 2  # มีใบเสร็จใน receipt_history.json
+    PENDING = 4  # คำนวณแล้วแต่ยังไม่ได้บันทึก (อยู่เฉพาะในหน่วยความจำ)
+
+    def __init__(self):
+        self.ts = array('d')
+        self.name1 = []
+        self.name2 = []
+        self.item = []
+        self.price = array('d')
+        self.weight = array('d')
+        self.total = array('d')
+        self.flags = array('B')
+        self.files = {}      # row id -> ไฟล์ PDF
+        self.raw_dates = {}  # row id -> วันที่ที่แปลงเป็น timestamp ไม่ได้
+        # ลำดับ row id ของแต่ละตาราง
+        self.calc_ids = array('l')
+        self.receipt_ids = array('l')
+        self._init_indexes()
+
+    def _init_indexes(self):
+        # ดัชนีเรียงลำดับ (ตาราง, คอลัมน์) -> [(sort key, row id)] สร้างเมื่อใช้ครั้งแรก
+        self._indexes = {}
+        # ข้อความตัวพิมพ์เล็กของชื่อ/สินค้าที่ไม่ซ้ำกัน สำหรับการกรอง
+        self._folded = {}
+        self._day_text = {}
+        for column in (self.name1, self.name2, self.item):
+            for value in column:
+                if value not in self._folded:
+                    self._folded[value] = value.casefold()
+
+    def __len__(self):
+        return len(self.flags)
+
+    def append(self, row, flags, file=None):
+        """เพิ่มรายการ (วันที่, ชื่อ1, ชื่อ2, สินค้า, ราคา, น้ำหนัก, รวม) และคืนค่า row id"""
+        date, name1, name2, item, price, weight, total = row[:7]
+        rowid = len(self.flags)
+        ts = parse_timestamp(date)
+        if ts is None:
+            self.raw_dates[rowid] = date
+            ts = float('nan')
+        self.ts.append(ts)
+        for column, value in ((self.name1, name1), (self.name2, name2), (self.item, item)):
+            value = sys.intern(str(value or ''))
+            column.append(value)
+            if value not in self._folded:
+                self._folded[value] = value.casefold()
+        self.price.append(float(price or 0))
+        self.weight.append(float(weight or 0))
+        self.total.append(float(total or 0))
+        self.flags.append(flags)
+        if flags & (self.LEDGER | self.PENDING):
+            self._add_to_view('calc', rowid)
+        if file:
+            self.set_file(rowid, file)
+        return rowid
+
+    def mark_ledger(self, rowid):
+        """ยืนยันว่ารายการถูกบันทึกลง Excel แล้ว"""
+        if not self.flags[rowid] & (self.LEDGER | self.PENDING):
+            self._add_to_view('calc', rowid)
+        self.flags[rowid] = (self.flags[rowid] | self.LEDGER) & ~self.PENDING
+
+    def set_file(self, rowid, filename):
+        """ผูกใบเสร็จ PDF กับรายการ"""
+        self.files[rowid] = filename
+        if not self.flags[rowid] & self.RECEIPT:
+            self._add_to_view('receipt', rowid)
+        self.flags[rowid] |= self.RECEIPT
+
+    def view_ids(self, view):
+        return self.calc_ids if view == 'calc' else self.receipt_ids
+
+    def _add_to_view(self, view, rowid):
+        self.view_ids(view).append(rowid)
+        for (index_view, column), index in self._indexes.items():
+            if index_view == view:
+                insort(index, (self.sort_key(column, rowid), rowid))
+
+    def sort_key(self, column, rowid):
+        """คีย์สำหรับเรียงลำดับที่เป็นชนิดข้อมูลจริง (timestamp, ตัวเลข, ข้อความ)"""
+        if column == 'date':
+            ts = self.ts[rowid]
+            return float('-inf') if ts != ts else ts
+        if column in ('price', 'weight', 'total'):
+            return getattr(self, column)[rowid]
+        if column == 'file':
+            return self.files.get(rowid, '')
+        return self._folded[getattr(self, column)[rowid]]
+
+    def sorted_ids(self, view, column):
+        """ดัชนีเรียงลำดับของตารางตามคอลัมน์ (สร้างครั้งแรกแล้วปรับปรุงทีละแถว)"""
+        key = (view, column)
+        if key not in self._indexes:
+            self._indexes[key] = sorted(
+                (self.sort_key(column, rowid), rowid) for rowid in self.view_ids(view))
+        return self._indexes[key]
+
+    def matcher(self, text):
+        """สร้างฟังก์ชันตรวจว่าแถวมีข้อความที่ค้นหา (ชื่อ, สินค้า, วันที่, ไฟล์)"""
+        needle = text.strip().casefold()
+        hits = {value for value, folded in self._folded.items() if needle in folded}
+        file_hits = {rowid for rowid, filename in self.files.items()
+                     if needle in filename.casefold()}
+        # วันที่มีเฉพาะตัวเลข / : และช่องว่าง ถ้าคำค้นมีอักษรอื่นไม่ต้องเทียบวันที่
+        check_dates = all(ch.isdigit() or ch in '/: ' for ch in needle)
+        day_text = self._day_text
+        ts, raw_dates = self.ts, self.raw_dates
+        name1, name2, item = self.name1, self.name2, self.item
+
+        def match(rowid):
+            if name1[rowid] in hits or name2[rowid] in hits or item[rowid] in hits:
+                return True
+            if rowid in file_hits:
+                return True
+            if not check_dates:
+                return False
+            if rowid in raw_dates:
+                return needle in str(raw_dates[rowid]).casefold()
+            day = int(ts[rowid] // 86400)
+            if day not in day_text:
+                day_text[day] = format_timestamp(day * 86400)[:10]
+            if needle in day_text[day]:
+                return True
+            return ':' in needle and needle in self.date(rowid)
+
+        return match
+
+    def date(self, rowid):
+        if rowid in self.raw_dates:
+            return self.raw_dates[rowid]
+        return format_timestamp(self.ts[rowid])
+
+    def row(self, rowid):
+        """ค่าของรายการสำหรับแสดงผล/บันทึก"""
+        return (self.date(rowid), self.name1[rowid], self.name2[rowid], self.item[rowid],
+                self.price[rowid], self.weight[rowid], self.total[rowid])
+
+    def receipt_row(self, rowid):
+        return (*self.row(rowid), self.files.get(rowid, ''))
+
+    def ledger_ids(self):
+        flags = self.flags
+        return (i for i in range(len(flags)) if flags[i] & self.LEDGER)
+
+    def load(self, ledger_rows, receipt_records):
+        """สร้างข้อมูลจากแถว Excel และประวัติใบเสร็จ โดยจับคู่รายการเดียวกันไว้แถวเดียว"""
+        keys = {}
+        for row in ledger_rows:
+            try:
+                rowid = self.append(row, self.LEDGER)
+            except (TypeError, ValueError) as e:
+                print(f"⚠️ ข้ามแถวที่อ่านไม่ได้ {row}: {e}")
+                continue
+            keys.setdefault(self.key(rowid), []).append(rowid)
+        for record in receipt_records:
+            try:
+                candidates = keys.get(self.record_key(record))
+                if candidates:
+                    self.set_file(candidates.pop(0), record[7] if len(record) > 7 else '')
+                else:
+                    self.append(record, self.RECEIPT,
+                                record[7] if len(record) > 7 else '')
+            except (TypeError, ValueError) as e:
+                print(f"⚠️ ข้ามใบเสร็จที่อ่านไม่ได้ {record}: {e}")
+
+    def key(self, rowid):
+        return self.record_key(self.row(rowid))
+
+    @staticmethod
+    def record_key(record):
+        date, name1, name2, item, price, weight, total = record[:7]
+        if isinstance(date, datetime):
+            date = date.strftime(DATE_FORMAT)
+        # Excel เก็บทศนิยมได้ 15 หลัก จึงปัดเศษก่อนเทียบกับค่าใน JSON
+        return (date, str(name1 or ''), str(name2 or ''), str(item or ''),
+                round(float(price or 0), 6), round(float(weight or 0), 6),
+                round(float(total or 0), 6))
+
+    def copy(self):
+        """สำเนาคอลัมน์ (ไม่รวมดัชนี) สำหรับ dump ใน thread อื่นโดยไม่ต้องหยุดหน้าจอนาน"""
+        store = RecordStore.__new__(RecordStore)
+        for name in ('ts', 'name1', 'name2', 'item', 'price', 'weight', 'total', 'flags',
+                     'calc_ids', 'receipt_ids'):
+            setattr(store, name, getattr(self, name)[:])
+        store.files = dict(self.files)
+        store.raw_dates = dict(self.raw_dates)
+        return store
+
+    def dump(self):
+        """ข้อมูลสำหรับ snapshot (ไม่รวมรายการที่ยังไม่ได้บันทึก)
+
+        คอลัมน์ข้อความเก็บเป็นรายการคำที่ไม่ซ้ำกับรหัสใน array เพื่อให้ pickle/โหลดได้เร็ว
+        """
+        saved = self.LEDGER | self.RECEIPT
+        if all(flag & saved for flag in self.flags):
+            def select(column):
+                return column
+            remap = None
+        else:
+            keep = [i for i in range(len(self.flags)) if self.flags[i] & saved]
+            remap = {old: new for new, old in enumerate(keep)}
+
+            def select(column):
+                return type(column)(column.typecode, (column[i] for i in keep)) \
+                    if isinstance(column, array) else [column[i] for i in keep]
+
+        def encode(values):
+            codes = {}
+            data = array('l', [codes.setdefault(v, len(codes)) for v in values])
+            return list(codes), data
+
+        def rows(ids):
+            return array('l', ids) if remap is None else array('l', (remap[i] for i in ids if i in remap))
+
+        def rowmap(mapping):
+            return dict(mapping) if remap is None else \
+                {remap[i]: value for i, value in mapping.items() if i in remap}
+
+        data = {name: select(getattr(self, name))
+                for name in ('ts', 'price', 'weight', 'total', 'flags')}
+        for name in ('name1', 'name2', 'item'):
+            data[name] = encode(select(getattr(self, name)))
+        data.update(files=rowmap(self.files), raw_dates=rowmap(self.raw_dates),
+                    calc_ids=rows(self.calc_ids), receipt_ids=rows(self.receipt_ids))
+        return data
+
+    @classmethod
+    def restore(cls, data):
+        store = cls()
+        for name, value in data.items():
+            setattr(store, name, value)
+        intern = sys.intern
+        folded = {}
+        for column in ('name1', 'name2', 'item'):
+            vocab, codes = data[column]
+            vocab = [intern(v) for v in vocab]
+            setattr(store, column, list(map(vocab.__getitem__, codes)))
+            for value in vocab:
+                if value not in folded:
+                    folded[value] = value.casefold()
+        store._indexes = {}
+        store._folded = folded
+        store._day_text = {}
+        return store
+
+
+TABLE_FIELDS = ('date', 'name1', 'name2', 'item', 'price', 'weight', 'total', 'file')
+
+
+class TableView:
+    """Treeview ที่แสดงหน้าหนึ่งของ RecordStore พร้อมคลิกหัวคอลัมน์เพื่อเรียงและกรองข้อความ"""
+
+    FILTER_DELAY_MS = 150
+
+    def __init__(self, root, tree, columns, headings, view):
+        self.root = root
+        self.tree = tree
+        self.view = view
+        self.store = None
+        self.headings = dict(zip(columns, headings))
+        self.fields = dict(zip(columns, TABLE_FIELDS))
+        self.sort_column = None
+        self.descending = False
+        self.filter_text = ''
+        self._matcher = None
+        self._pending_filter = None
+        for col in columns:
+            tree.heading(col, text=self.headings[col],
+                         command=lambda c=col: self.sort_by(c))
+
+    def attach(self, store):
+        """เปลี่ยนไปแสดงข้อมูลจาก store ใหม่ (เช่น หลังโหลดข้อมูลใหม่)"""
+        self.store = store
+        self._matcher = store.matcher(self.filter_text) if self.filter_text else None
+        self.refresh()
+
+    def sort_by(self, column):
+        """คลิกหัวคอลัมน์: เรียงจากน้อยไปมาก คลิกซ้ำเพื่อสลับ"""
+        if self.sort_column == column:
+            self.descending = not self.descending
+        else:
+            self.sort_column, self.descending = column, False
+        for col, text in self.headings.items():
+            arrow = (" ▼" if self.descending else " ▲") if col == column else ""
+            self.tree.heading(col, text=text + arrow)
+        self.refresh()
+
+    def schedule_filter(self, text):
+        """กรองหลังหยุดพิมพ์ครู่หนึ่ง เพื่อไม่ให้คำนวณซ้ำทุกตัวอักษร"""
+        if self._pending_filter is not None:
+            self.root.after_cancel(self._pending_filter)
+        self._pending_filter = self.root.after(
+            self.FILTER_DELAY_MS, lambda: self.set_filter(text))
+
+    def set_filter(self, text):
+        self._pending_filter = None
+        self.filter_text = text.strip()
+        self._matcher = self.store.matcher(self.filter_text) if self.filter_text else None
+        self.refresh()
+
+    def append(self, rowid):
+        """แสดงแถวที่เพิ่งเพิ่มใน store"""
+        if self.filter_text:
+            # อาจมีชื่อใหม่ที่ตัวกรองเดิมยังไม่รู้จัก
+            self._matcher = self.store.matcher(self.filter_text)
+        if self.sort_column is None and self._matcher is None:
+            values = self._values(rowid)
+            self.tree.insert("", "end", iid=str(rowid), values=values)
+            children = self.tree.get_children()
+            if len(children) > HISTORY_PAGE_SIZE:
+                self.tree.delete(*children[:len(children) - HISTORY_PAGE_SIZE])
+        else:
+            self.refresh()
+
+    def _values(self, rowid):
+        if self.view == 'receipt':
+            return self.store.receipt_row(rowid)
+        return self.store.row(rowid)
+
+    def _page_ids(self):
+        """row id ของหน้าที่จะแสดง ตามการเรียงและตัวกรองปัจจุบัน"""
+        match = self._matcher
+        page = []
+        if self.sort_column is None:
+            # ค่าเริ่มต้น: รายการล่าสุดอยู่ล่างสุด
+            for rowid in reversed(self.store.view_ids(self.view)):
+                if match is None or match(rowid):
+                    page.append(rowid)
+                    if len(page) >= HISTORY_PAGE_SIZE:
+                        break
+            page.reverse()
+            return page
+        index = self.store.sorted_ids(self.view, self.fields[self.sort_column])
+        for _, rowid in (reversed(index) if self.descending else index):
+            if match is None or match(rowid):
+                page.append(rowid)
+                if len(page) >= HISTORY_PAGE_SIZE:
+                    break
+        return page
+
+    def refresh(self):
+        """แสดงหน้าใหม่โดยลบ/เพิ่มเฉพาะแถวที่เปลี่ยนแทนการสร้างตารางใหม่ทั้งหมด"""
+        if self.store is None:
+            return
+        target = [str(rowid) for rowid in self._page_ids()]
+        wanted = set(target)
+        current = self.tree.get_children()
+        stale = [iid for iid in current if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+        shown = set(current) - set(stale)
+        for index, iid in enumerate(target):
+            if iid in shown:
+                self.tree.move(iid, "", index)
+            else:
+                self.tree.insert("", index, iid=iid, values=self._values(int(iid)))
+
+
+# คำนำหน้าชื่อที่ตัดออกเพื่อให้ค้นหาด้วยชื่อจริงได้ (เรียงคำยาวก่อน)
+THAI_NAME_TITLES = ('นางสาว', 'น.ส.', 'นาง', 'นาย', 'ด.ช.', 'ด.ญ.', 'คุณ')
+_INVISIBLE_RE = re.compile('[\u200b\u200c\u200d\u2060\ufeff]')
+# สระ/วรรณยุกต์ที่พิมพ์ซ้ำติดกัน เช่น ไม้เอกสองครั้ง
+_REPEATED_MARK_RE = re.compile('([\u0e31\u0e34-\u0e3a\u0e47-\u0e4e])\\1+')
+
+
+def normalize_party_name(name):
+    """ทำให้ชื่อที่พิมพ์ต่างกันเล็กน้อยเทียบกันได้ (ช่องว่าง, อักขระล่องหน, สระอำ, วรรณยุกต์ซ้ำ)"""
+    text = unicodedata.normalize('NFC', str(name))
+    text = _INVISIBLE_RE.sub('', text)
+    text = text.replace('\u0e4d\u0e32', '\u0e33')  # นิคหิต + สระอา → สระอำ
+    text = _REPEATED_MARK_RE.sub('\\1', text)
+    return ' '.join(text.split()).casefold()
+
+
+def _party_search_keys(key):
+    """คีย์ที่ใช้ค้นหาชื่อ: ชื่อเต็ม และชื่อที่ตัดคำนำหน้าออก"""
+    keys = [key]
+    for title in THAI_NAME_TITLES:
+        if key.startswith(title) and len(key) > len(title):
+            keys.append(key[len(title):].lstrip())
+            break
+    return keys
+
+
+class PartyDirectory:
+    """รายชื่อคู่ค้าจากประวัติ พร้อมดัชนีเรียงลำดับสำหรับเติมชื่ออัตโนมัติตามความถี่"""
+
+    TOP_K = 20
+    CACHE_MIN_RANGE = 512  # ช่วงที่ใหญ่กว่านี้จะเก็บผลอันดับไว้ใน cache
+
+    def __init__(self):
+        # key -> [จำนวนครั้ง, timestamp ล่าสุด, ชื่อที่แสดง, สินค้าล่าสุด, ราคาล่าสุด]
+        self.entries = {}
+        self._index = []   # [(search key, key)] เรียงลำดับ
+        self._top = {}     # prefix -> [key] อันดับสูงสุด TOP_K รายการ
+
+    def _rank(self, key):
+        count, ts = self.entries[key][0], self.entries[key][1]
+        return (count, ts)
+
+    def build(self, store, column):
+        """สร้างรายชื่อทั้งหมดจาก record store ในครั้งเดียว"""
+        self.entries = {}
+        names = getattr(store, column)
+        normalized = {}
+        for rowid in range(len(store)):
+            if not store.flags[rowid] & (RecordStore.LEDGER | RecordStore.RECEIPT):
+                continue
+            name = names[rowid]
+            if not name:
+                continue
+            if name not in normalized:
+                normalized[name] = normalize_party_name(name)
+            self._update(normalized[name], name, store.item[rowid],
+                         store.price[rowid], store.ts[rowid])
+        self._index = sorted((search_key, key) for key in self.entries
+                             for search_key in _party_search_keys(key))
+        self._warm_cache()
+
+    def _update(self, key, name, item, price, ts):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = [0, float('-inf'), name, item, price]
+        entry[0] += 1
+        if not ts < entry[1]:  # รายการล่าสุด (หรือวันที่อ่านไม่ได้) เป็นข้อมูลล่าสุด
+            entry[1] = ts if ts == ts else entry[1]
+            entry[2], entry[3], entry[4] = name, item, price
+        return entry
+
+    def _warm_cache(self):
+        """คำนวณอันดับล่วงหน้าของทุก prefix ที่ครอบคลุมชื่อจำนวนมาก (เช่น 'น', 'นาย')"""
+        self._top = {}
+        index = self._index
+        ranges = [(0, len(index), '')]
+        while ranges:
+            next_ranges = []
+            for lo, hi, parent in ranges:
+                length = len(parent) + 1
+                position = lo
+                while position < hi:
+                    search_key = index[position][0]
+                    if len(search_key) < length:
+                        position += 1
+                        continue
+                    prefix = search_key[:length]
+                    end = bisect_left(index, (prefix + '\U0010ffff',), position, hi)
+                    if end - position >= self.CACHE_MIN_RANGE:
+                        keys = {index[i][1] for i in range(position, end)}
+                        self._top[prefix] = heapq.nlargest(self.TOP_K, keys, key=self._rank)
+                        next_ranges.append((position, end, prefix))
+                    position = end
+            ranges = next_ranges
+
+    def record(self, name, item=None, price=None, ts=None):
+        """เพิ่มหนึ่งรายการ (ปรับดัชนีและอันดับเฉพาะส่วนที่เกี่ยวข้อง)"""
+        name = str(name or '').strip()
+        if not name:
+            return
+        key = normalize_party_name(name)
+        is_new = key not in self.entries
+        self._update(key, name, item, price, float('nan') if ts is None else ts)
+        search_keys = _party_search_keys(key)
+        if is_new:
+            for search_key in search_keys:
+                insort(self._index, (search_key, key))
+        # จำนวนครั้งเพิ่มขึ้นอย่างเดียว จึงปรับอันดับใน cache ได้ทันทีโดยไม่ต้องคำนวณใหม่
+        rank = self._rank(key)
+        for search_key in search_keys:
+            for end in range(1, len(search_key) + 1):
+                top = self._top.get(search_key[:end])
+                if top is None:
+                    continue
+                if key not in top:
+                    if len(top) >= self.TOP_K and rank <= self._rank(top[-1]):
+                        continue
+                    top.append(key)
+                top.sort(key=self._rank, reverse=True)
+                del top[self.TOP_K:]
+
+    def suggest(self, text, limit=8):
+        """ชื่อที่ขึ้นต้นด้วยข้อความที่พิมพ์ เรียงตามความถี่และความใหม่"""
+        prefix = normalize_party_name(text)
+        if not prefix:
+            return []
+        top = self._top.get(prefix)
+        if top is None:
+            index = self._index
+            start = bisect_left(index, (prefix,))
+            keys = set()
+            position = start
+            while position < len(index) and index[position][0].startswith(prefix):
+                keys.add(index[position][1])
+                position += 1
+            top = heapq.nlargest(self.TOP_K, keys, key=self._rank)
+            if position - start >= self.CACHE_MIN_RANGE:
+                self._top[prefix] = top
+        return [self.entries[key][2] for key in top[:limit]]
+
+    def lookup(self, name):
+        """ข้อมูลล่าสุดของคู่ค้า: (ชื่อที่แสดง, สินค้าล่าสุด, ราคาล่าสุด) หรือ None"""
+        entry = self.entries.get(normalize_party_name(name))
+        return None if entry is None else (entry[2], entry[3], entry[4])
+
+    def canonical(self, name):
+        """ชื่อที่เคยใช้ของคู่ค้าคนเดียวกัน (ถ้ามี) เพื่อไม่ให้พิมพ์ต่างกันแล้วแยกเป็นหลายราย"""
+        found = self.lookup(name)
+        return found[0] if found else name
+
+    def dump(self):
+        return {'entries': self.entries, 'index': self._index, 'top': self._top}
+
+    @classmethod
+    def restore(cls, data):
+        directory = cls()
+        directory.entries = data['entries']
+        directory._index = data['index']
+        directory._top = data['top']
+        return directory
+
+
+# --- แจ้งเตือนระดับสินค้าคงคลัง ---
+ALERTS_FILE = 'alerts.json'
+
+
+class StockAlert(namedtuple('StockAlert', 'kind item level threshold previous mode')):
+    """เหตุการณ์เมื่อยอดคงคลังข้ามระดับที่ตั้งไว้ (kind: above, below, negative)"""
+
+    def message(self):
+        if self.kind == 'above':
+            return (f"📢 {self.item} คงคลัง {self.level:,.2f} กก. ถึงระดับ "
+                    f"{self.threshold:,.2f} กก. แล้ว (คุ้มเรียกโรงงานมารับ)")
+        if self.kind == 'below':
+            return (f"📉 {self.item} คงคลังต่ำกว่า {self.threshold:,.2f} กก. "
+                    f"(เหลือ {self.level:,.2f} กก.)")
+        return (f"⚠️ {self.item} คงคลังติดลบ {self.level:,.2f} กก. "
+                f"(อาจบันทึกการจำหน่ายก่อนรับซื้อ)")
+
+    def to_dict(self):
+        return dict(self._asdict(), time=datetime.now().strftime(DATE_FORMAT),
+                    message=self.message())
+
+
+class LogFileSink:
+    """บันทึกการแจ้งเตือนต่อท้ายไฟล์ (หนึ่งบรรทัด JSON ต่อหนึ่งเหตุการณ์)"""
+
+    def __init__(self, path=os.path.join('data', 'alerts.log')):
+        self.path = path
+
+    def __call__(self, alert):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(alert.to_dict(), ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """ส่งการแจ้งเตือนเป็น JSON ไปยัง URL (เช่น บริการในเครื่อง) โดยไม่ให้หน้าร้านต้องรอ"""
+
+    def __init__(self, url, timeout=3):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, alert):
+        threading.Thread(target=self._post, args=(alert.to_dict(),), daemon=True).start()
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json; charset=utf-8'})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except Exception as e:
+            print(f"⚠️ ส่งการแจ้งเตือนไปที่ {self.url} ไม่สำเร็จ: {e}")
+
+
+# ชนิดของปลายทางที่ตั้งค่าได้ใน alerts.json
+ALERT_SINKS = {'log': LogFileSink, 'webhook': WebhookSink}
+
+
+def load_alert_config(path=ALERTS_FILE):
+    """อ่านระดับแจ้งเตือนรายสินค้าและปลายทางการแจ้งเตือนจาก alerts.json
+
+    ตัวอย่าง: {"thresholds": {"ทองแดง (เบอร์ 1)": {"high": 100}},
+              "sinks": [{"type": "log", "path": "data/alerts.log"},
+                        {"type": "webhook", "url": "http://127.0.0.1:8765/alerts"}]}
+    """
+    config = {'thresholds': {}, 'sinks': [{'type': 'log'}]}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                config.update(loaded)
+            else:
+                print(f"⚠️ {path} ต้องเป็น JSON object ใช้ค่าเริ่มต้นแทน")
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ ไม่สามารถอ่าน {path}: {e}")
+    return _valid_thresholds(config['thresholds']), _build_sinks(config['sinks'])
+
+
+def _is_weight(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _valid_thresholds(raw):
+    """เก็บเฉพาะระดับแจ้งเตือนที่เป็นตัวเลข ค่าที่ผิดจะถูกข้ามพร้อมคำเตือน ไม่ให้ไปพังตอนบันทึก"""
+    if not isinstance(raw, dict):
+        print(f"⚠️ thresholds ใน alerts.json ต้องเป็น object ไม่ใช่ {raw!r} ข้ามทั้งหมด")
+        return {}
+    thresholds = {}
+    for item, limits in raw.items():
+        if not isinstance(limits, dict):
+            print(f"⚠️ ระดับแจ้งเตือนของ {item} ต้องเป็น object เช่น {{\"high\": 100}} ข้ามสินค้านี้: {limits!r}")
+            continue
+        valid = {}
+        for key in ('high', 'low'):
+            if key not in limits:
+                continue
+            if _is_weight(limits[key]):
+                valid[key] = float(limits[key])
+            else:
+                print(f"⚠️ ระดับ {key} ของ {item} ต้องเป็นตัวเลข ข้ามค่านี้: {limits[key]!r}")
+        if valid:
+            thresholds[item] = valid
+    return thresholds
+
+
+def _build_sinks(entries):
+    if not isinstance(entries, list):
+        print(f"⚠️ sinks ใน alerts.json ต้องเป็นรายการ ไม่ใช่ {entries!r} ข้ามทั้งหมด")
+        return []
+    sinks = []
+    for entry in entries:
+        # ค่าที่ผิดในไฟล์ตั้งค่าต้องไม่ทำให้เปิดโปรแกรมไม่ได้ ข้ามเฉพาะปลายทางนั้น
+        try:
+            spec = dict(entry)
+            sink_type = spec.pop('type', None)
+            if sink_type not in ALERT_SINKS:
+                print(f"⚠️ ไม่รู้จักปลายทางการแจ้งเตือน: {sink_type}")
+                continue
+            sinks.append(ALERT_SINKS[sink_type](**spec))
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ ตั้งค่าปลายทางการแจ้งเตือน {entry} ไม่ถูกต้อง ข้ามปลายทางนี้: {e}")
+    return sinks
+
+
+class Inventory:
+    """ยอดรับเข้า/จำหน่ายออกสะสมรายสินค้า อัปเดตทีละรายการได้โดยไม่ต้องสแกนใหม่
+
+    ยอดตั้งต้นมาจาก DailyRollups.stock() (ยอดสิ้นวันที่ปิดล่าสุด + วันที่ยังเปิด) แล้ว apply()
+    ทีละรายการที่บันทึก ผู้สนใจ subscribe() เพื่อรับ StockAlert เมื่อรายการใดทำให้
+    ยอดคงคลังข้ามระดับที่ตั้งไว้
+    """
+
+    def __init__(self, stock=None, thresholds=None):
+        self.stock = stock if stock is not None else {}
+        # สินค้า -> {'high': กก., 'low': กก.}
+        self.thresholds = thresholds or {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """ลงทะเบียนฟังก์ชันที่รับ StockAlert และคืนค่าฟังก์ชันสำหรับยกเลิก"""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def apply(self, mode, item, weight):
+        """บวกน้ำหนักของหนึ่งรายการเข้าในยอดสะสม แล้วแจ้งเหตุการณ์ถ้าข้ามระดับ"""
+        previous = self.remaining(item)
+        if item not in self.stock:
+            self.stock[item] = {'in': 0, 'out': 0}
+        self.stock[item][mode] += float(weight)
+        if self._subscribers:
+            for alert in self.check(item, previous, mode):
+                for callback in list(self._subscribers):
+                    try:
+                        callback(alert)
+                    except Exception as e:
+                        print(f"❌ ส่งการแจ้งเตือนไม่สำเร็จ: {e}")
+
+    def check(self, item, previous, mode=None):
+        """เหตุการณ์ที่เกิดจากการเปลี่ยนยอดคงคลังของสินค้าจาก previous เป็นยอดปัจจุบัน"""
+        level = self.remaining(item)
+        alerts = []
+        limits = self.thresholds.get(item, {})
+        high, low = limits.get('high'), limits.get('low')
+        if high is not None and previous < high <= level:
+            alerts.append(StockAlert('above', item, level, high, previous, mode))
+        if low is not None and previous >= low > level:
+            alerts.append(StockAlert('below', item, level, low, previous, mode))
+        if previous >= 0 > level:
+            alerts.append(StockAlert('negative', item, level, 0, previous, mode))
+        return alerts
+
+    def remaining(self, item):
+        data = self.stock.get(item, {'in': 0, 'out': 0})
+        return data['in'] - data['out']
+
+
+# --- ล็อกโฟลเดอร์ข้อมูล: หน้าร้านกับงานที่เขียนไฟล์ข้อมูลใหม่ทั้งไฟล์ต้องไม่ทำงานพร้อมกัน ---
+DATA_LOCK_FILE = os.path.join('data', 'scrapshop.lock')
+DATA_LOCK_OFFSET = 1 << 20  # Windows ล็อกแบบบังคับ จึงล็อก byte ที่อยู่เลยชื่อผู้ถือไปเพื่อให้ยังอ่านชื่อได้
+
+
+class DataLock:
+    """ล็อก exclusive ของโฟลเดอร์ข้อมูลผ่าน file lock ของระบบ (ปล่อยเองเมื่อ process จบ แม้ถูกปิดกลางคัน)
+
+    หน้าร้านถือไว้ตลอดที่เปิดโปรแกรม งานที่เขียนไฟล์ข้อมูลใหม่ทั้งไฟล์ (--archive,
+    --reconcile --repair, --restore) ถือไว้ตั้งแต่อ่านจนเขียนเสร็จ ผู้ที่มาทีหลังได้ RuntimeError
+    ที่บอกว่าใครถือล็อกอยู่
+    """
+
+    def __init__(self, root='.', owner='โปรแกรมหน้าร้าน'):
+        self.path = os.path.join(root, DATA_LOCK_FILE)
+        self.owner = owner
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(DATA_LOCK_OFFSET)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.seek(0)
+            holder = f.read().decode('utf-8', 'replace').strip() or 'โปรแกรมอื่น'
+            f.close()
+            raise RuntimeError(f"ข้อมูลใน {os.path.dirname(self.path)} กำลังถูกใช้โดย {holder} "
+                               f"กรุณาปิดหรือรอให้เสร็จก่อนแล้วลองอีกครั้ง")
+        f.seek(0)
+        f.truncate()
+        f.write(f"{self.owner} (pid {os.getpid()})".encode('utf-8'))
+        f.flush()
+        self._file = f
+        return self
+
+    def release(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.truncate()
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(DATA_LOCK_OFFSET)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+# --- ข้อมูลเก่าที่เก็บถาวร (segment บีบอัดแยกคอลัมน์) ---
+ARCHIVE_DIR = os.path.join('data', 'archive')
+SEGMENT_MAGIC = b'SSEG1\n'
+SEGMENT_COLUMNS = ('ts', 'name1', 'name2', 'item', 'price', 'weight', 'total', 'flags', 'file')
+
+
+def write_segment(path, columns):
+    """เขียน segment: หัวไฟล์ JSON บอกตำแหน่งของแต่ละคอลัมน์ที่บีบอัดแยกกัน"""
+    header = {'byteorder': sys.byteorder, 'columns': {}}
+    blobs, offset = [], 0
+    for name in SEGMENT_COLUMNS:
+        value = columns[name]
+        if isinstance(value, array):
+            kind, raw = value.typecode, value.tobytes()
+        else:
+            kind, raw = 'json', json.dumps(list(value), ensure_ascii=False).encode('utf-8')
+        blob = zlib.compress(raw, 9)
+        header['columns'][name] = [offset, len(blob), kind]
+        blobs.append(blob)
+        offset += len(blob)
+    head = json.dumps(header).encode('utf-8')
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(SEGMENT_MAGIC + struct.pack('>I', len(head)) + head)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_file, path)
+
+
+def read_segment(path, columns=SEGMENT_COLUMNS):
+    """อ่านเฉพาะคอลัมน์ที่ต้องการจาก segment"""
+    with open(path, 'rb') as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"ไม่ใช่ไฟล์ segment: {path}")
+        (head_size,) = struct.unpack('>I', f.read(4))
+        header = json.loads(f.read(head_size).decode('utf-8'))
+        base = f.tell()
+        result = {}
+        for name in columns:
+            offset, size, kind = header['columns'][name]
+            f.seek(base + offset)
+            raw = zlib.decompress(f.read(size))
+            if kind == 'json':
+                result[name] = json.loads(raw.decode('utf-8'))
+            else:
+                value = array(kind)
+                value.frombytes(raw)
+                if header['byteorder'] != sys.byteorder:
+                    value.byteswap()
+                result[name] = value
+        return result
+
+
+class ArchiveStore:
+    """segment ของข้อมูลเก่าพร้อม manifest (ช่วงวันที่และสรุปรายสินค้า) เพื่อข้าม segment ที่ไม่เกี่ยวข้อง"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, 'manifest.json')
+        self.segments = []
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                self.segments = json.load(f).get('segments', [])
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'segments': self.segments}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_file, self.manifest_file)
+
+    def segment(self, mode, period):
+        for meta in self.segments:
+            if meta['mode'] == mode and meta['period'] == period:
+                return meta
+        return None
+
+    def segments_for(self, mode, start_ts=None, end_ts=None, item=None):
+        """segment ที่อาจมีรายการในช่วงเวลา/สินค้าที่ต้องการ"""
+        for meta in self.segments:
+            if meta['mode'] != mode:
+                continue
+            if start_ts is not None and meta['max_ts'] < start_ts:
+                continue
+            if end_ts is not None and meta['min_ts'] >= end_ts:
+                continue
+            if item is not None and item not in meta['items'] and item not in meta.get('other_items', ()):
+                continue
+            yield meta
+
+    def query(self, mode, start_ts=None, end_ts=None, item=None, ledger_only=False):
+        """รายการที่เก็บถาวร (วันที่, ชื่อ1, ชื่อ2, สินค้า, ราคา, น้ำหนัก, รวม, ไฟล์) ในช่วง [start, end)
+
+        ledger_only=True คืนเฉพาะรายการที่เคยอยู่ใน Excel (ตรงกับยอดใน summary)
+        """
+        for meta in self.segments_for(mode, start_ts, end_ts, item):
+            data = read_segment(os.path.join(self.directory, meta['file']))
+            for i, ts in enumerate(data['ts']):
+                if ledger_only and not data['flags'][i] & RecordStore.LEDGER:
+                    continue
+                if start_ts is not None and ts < start_ts:
+                    continue
+                if end_ts is not None and ts >= end_ts:
+                    continue
+                if item is not None and data['item'][i] != item:
+                    continue
+                yield (format_timestamp(ts), data['name1'][i], data['name2'][i], data['item'][i],
+                       data['price'][i], data['weight'][i], data['total'][i], data['file'][i])
+
+    def summary(self, mode, start_ts=None, end_ts=None):
+        """ยอดรายสินค้า {สินค้า: [กก., บาท, จำนวนรายการ]} ของรายการใน Excel ที่เก็บถาวรในช่วงเวลา
+
+        segment ที่อยู่ในช่วงทั้งหมดใช้สรุปใน manifest ได้เลย อ่านไฟล์เฉพาะ segment ที่คร่อมขอบช่วง
+        """
+        totals = {}
+        for meta in self.segments_for(mode, start_ts, end_ts):
+            inside = (start_ts is None or meta['min_ts'] >= start_ts) and \
+                     (end_ts is None or meta['max_ts'] < end_ts)
+            if inside:
+                for item, values in meta['items'].items():
+                    row = totals.setdefault(item, [0.0, 0.0, 0])
+                    for i, value in enumerate(values):
+                        row[i] += value
+                continue
+            data = read_segment(os.path.join(self.directory, meta['file']),
+                                ('ts', 'item', 'weight', 'total', 'flags'))
+            for i, ts in enumerate(data['ts']):
+                if not data['flags'][i] & RecordStore.LEDGER:
+                    continue
+                if (start_ts is None or ts >= start_ts) and (end_ts is None or ts < end_ts):
+                    row = totals.setdefault(data['item'][i], [0.0, 0.0, 0])
+                    row[0] += data['weight'][i]
+                    row[1] += data['total'][i]
+                    row[2] += 1
+        return totals
+
+    def referenced_files(self):
+        """ไฟล์ใบเสร็จ PDF ที่รายการเก็บถาวรอ้างถึง"""
+        files = set()
+        for meta in self.segments:
+            data = read_segment(os.path.join(self.directory, meta['file']), ('file',))
+            files.update(normalize_receipt_path(f) for f in data['file'] if f)
+        return files
+
+
+# --- ยอดปิดประจำวัน ---
+ROLLUPS_FILE = os.path.join('data', 'daily_rollups.json')
+ROLLUPS_OPEN_FILE = os.path.join('data', 'daily_rollups_open.json')
+
+
+def day_key(ts):
+    """วันที่ 'YYYY-MM-DD' ของเวลาแบบ epoch (naive)"""
+    return (_EPOCH + timedelta(days=int(ts // 86400))).strftime('%Y-%m-%d')
+
+
+def _add_figures(figures, mode, item, kg, amount, count=1):
+    values = figures[mode].setdefault(item, [0.0, 0.0, 0])
+    values[0] += kg
+    values[1] += amount
+    values[2] += count
+
+
+def group_by_day(stores, days=None, undated=None):
+    """ยอดรายวันรายสินค้า {วัน: {'in': {สินค้า: [กก., บาท, รายการ]}, 'out': {...}}} ของรายการใน Excel
+
+    รายการที่อ่านวันที่ไม่ได้ (ts เป็น NaN เช่น แก้ Excel ด้วยมือผิดรูปแบบ) ไม่มีวันให้ลง
+    จะรวมไว้ใน undated ({'in': {...}, 'out': {...}}) ถ้าส่งมา
+    """
+    days = {} if days is None else days
+    for mode, store in stores.items():
+        for rowid in store.ledger_ids():
+            ts, item = store.ts[rowid], store.item[rowid]
+            if not item:
+                continue
+            if ts == ts:
+                figures = days.setdefault(day_key(ts), {'in': {}, 'out': {}})
+            elif undated is not None:
+                figures = undated
+            else:
+                continue
+            _add_figures(figures, mode, item, store.weight[rowid], store.total[rowid])
+    return days
+
+
+def _figures_count(figures):
+    return sum(values[2] for mode in ('in', 'out') for values in figures[mode].values())
+
+
+def _segment_days(archive, meta, days):
+    """บวกยอดรายวันของรายการ Excel ใน segment ที่เก็บถาวรเข้าใน days"""
+    data = read_segment(os.path.join(archive.directory, meta['file']),
+                        ('ts', 'item', 'weight', 'total', 'flags'))
+    for i, ts in enumerate(data['ts']):
+        if data['flags'][i] & RecordStore.LEDGER and data['item'][i]:
+            figures = days.setdefault(day_key(ts), {'in': {}, 'out': {}})
+            _add_figures(figures, meta['mode'], data['item'][i], data['weight'][i], data['total'][i])
+    return days
+
+
+def _same_figures(a, b):
+    def rounded(figures):
+        return {mode: {item: (round(kg, 6), round(amount, 6), count)
+                       for item, (kg, amount, count) in (figures or {}).get(mode, {}).items()}
+                for mode in ('in', 'out')}
+    return rounded(a) == rounded(b)
+
+
+class DailyRollups:
+    """ยอดปิดประจำวันรายสินค้าของทั้งสองโหมด พร้อมยอดรับเข้า/จำหน่ายออกสะสม ณ สิ้นวัน
+
+    วันที่ปิดแล้วเก็บใน daily_rollups.json รายงานช่วงเวลาและยอดคงคลังจึงอ่านแค่แถวรายวัน
+    ส่วนวันที่ยังไม่ปิด (ปกติคือวันนี้) อัปเดตทีละรายการและเขียนลง daily_rollups_open.json
+    พร้อมขนาด/เวลาแก้ไขของไฟล์ Excel (ledgers) ในขณะนั้น เพื่อให้รายงานที่รันแยกจากหน้าร้าน
+    ใช้ยอดนี้แทนการอ่าน Excel ได้ตราบใดที่ Excel ยังไม่ถูกแก้จากที่อื่น
+    """
+
+    def __init__(self, path=ROLLUPS_FILE, ledgers=None):
+        self.path = path
+        self.open_path = os.path.join(os.path.dirname(path), os.path.basename(ROLLUPS_OPEN_FILE))
+        self.ledgers = ledgers  # โหมด -> ไฟล์ Excel ที่ยอดของวันที่ยังเปิดคำนวณมา
+        self.days = {}  # วัน -> {'in': {...}, 'out': {...}, 'closing': {สินค้า: [รับเข้าสะสม, จำหน่ายสะสม]}}
+        self.closed_through = None
+        self.open = {}  # วันที่ยังไม่ปิด -> {'in': {...}, 'out': {...}}
+        self.undated = {'in': {}, 'out': {}}  # รายการใน Excel ที่อ่านวันที่ไม่ได้ นับในคงคลังเท่านั้น
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.days = data['days']
+                self.closed_through = data['closed_through']
+            except (json.JSONDecodeError, OSError, KeyError) as e:
+                print(f"⚠️ ไม่สามารถอ่าน {path} จะสร้างยอดปิดประจำวันใหม่: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'closed_through': self.closed_through, 'days': self.days},
+                      f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_file, self.path)
+        self.save_open()
+
+    def _ledger_stats(self):
+        return {mode: _stat_key(path) for mode, path in self.ledgers.items()}
+
+    def save_open(self):
+        """เขียนยอดของวันที่ยังเปิด (ไฟล์เล็ก เขียนทุกครั้งที่บันทึกรายการ)"""
+        if self.ledgers is None:
+            return
+        # เขียนไม่สำเร็จไม่กระทบการบันทึกรายการ รายงานจะเห็นว่า Excel ไม่ตรงแล้วอ่าน Excel แทน
+        try:
+            tmp_file = f"{self.open_path}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'closed_through': self.closed_through, 'ledgers': self._ledger_stats(),
+                           'open': self.open, 'undated': self.undated}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.open_path)
+        except OSError as e:
+            print(f"⚠️ ไม่สามารถบันทึก {self.open_path}: {e}")
+
+    def load_open(self):
+        """อ่านยอดของวันที่ยังเปิดที่หน้าร้านเขียนไว้ คืนค่า False ถ้าไม่มีหรือ Excel เปลี่ยนหลังจากนั้น"""
+        try:
+            with open(self.open_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ ไม่สามารถอ่าน {self.open_path}: {e}")
+            return False
+        stats = {mode: tuple(stat) if stat else None for mode, stat in data.get('ledgers', {}).items()}
+        if data.get('closed_through') != self.closed_through or stats != self._ledger_stats():
+            return False
+        self.open = data['open']
+        self.undated = data.get('undated', {'in': {}, 'out': {}})
+        return True
+
+    def is_closed(self, day):
+        return self.closed_through is not None and day <= self.closed_through
+
+    def add(self, mode, ts, item, kg, amount):
+        """บวกหนึ่งรายการ คืนค่า True ถ้าเป็นรายการย้อนหลังที่ทำให้วันที่ปิดแล้วเปลี่ยน (ต้อง save)"""
+        if ts != ts:
+            _add_figures(self.undated, mode, item, kg, amount)
+            return False
+        day = day_key(ts)
+        if not self.is_closed(day):
+            _add_figures(self.open.setdefault(day, {'in': {}, 'out': {}}), mode, item, kg, amount)
+            return False
+        figures = self.days.setdefault(day, {'in': {}, 'out': {}, 'closing': {}})
+        _add_figures(figures, mode, item, kg, amount)
+        self._recompute_closing(day)
+        return True
+
+    def replace_day(self, day, figures):
+        """แทนยอดของวันที่ปิดแล้วหนึ่งวันด้วยยอดที่คำนวณใหม่"""
+        if figures and (figures['in'] or figures['out']):
+            self.days[day] = {'in': figures['in'], 'out': figures['out'], 'closing': {}}
+        else:
+            self.days.pop(day, None)
+        self._recompute_closing(day)
+
+    def _closing_before(self, day):
+        earlier = [d for d in self.days if d < day]
+        return self.days[max(earlier)]['closing'] if earlier else {}
+
+    def _recompute_closing(self, start_day):
+        """คำนวณยอดสะสมสิ้นวันใหม่ตั้งแต่ start_day (วันก่อนหน้าไม่เปลี่ยน)"""
+        closing = {item: list(values) for item, values in self._closing_before(start_day).items()}
+        for day in sorted(d for d in self.days if d >= start_day):
+            figures = self.days[day]
+            for index, mode in enumerate(('in', 'out')):
+                for item, (kg, _, _) in figures[mode].items():
+                    closing.setdefault(item, [0.0, 0.0])[index] += kg
+            figures['closing'] = {item: list(values) for item, values in closing.items()}
+
+    def close(self, through):
+        """ปิดยอดทุกวันที่ยังเปิดอยู่จนถึงวัน through แล้วบันทึกไฟล์ คืนค่ารายการวันที่ปิด"""
+        closing = sorted(day for day in self.open if day <= through)
+        for day in closing:
+            figures = self.open.pop(day)
+            self.days[day] = {'in': figures['in'], 'out': figures['out'], 'closing': {}}
+        if closing:
+            self._recompute_closing(closing[0])
+        if self.closed_through is None or through > self.closed_through:
+            self.closed_through = through
+            self.save()
+        return closing
+
+    def sync(self, live_days, archive, through, undated=None):
+        """ตรวจยอดวันที่ปิดแล้วกับข้อมูลปัจจุบัน คำนวณใหม่เฉพาะวันที่ไม่ตรง แล้วปิดยอดถึง through
+
+        live_days คือยอดรายวันจาก Excel ที่ใช้งาน เดือนที่เก็บถาวรตรวจด้วยยอดรวมใน manifest
+        และอ่าน segment เฉพาะเดือนที่ไม่ตรงกัน undated คือรายการใน Excel ที่อ่านวันที่ไม่ได้
+        """
+        self.undated = undated or {'in': {}, 'out': {}}
+        if _figures_count(self.undated):
+            print(f"⚠️ มี {_figures_count(self.undated)} รายการใน Excel ที่อ่านวันที่ไม่ได้ "
+                  f"(ต้องเป็น dd/mm/YYYY) นับรวมในสินค้าคงคลังแต่ไม่อยู่ในยอดรายวันและรายงานช่วงเวลา")
+        archived = {}
+        for meta in archive.segments:
+            archived.setdefault(meta['period'], []).append(meta)
+        if self.closed_through is None:
+            days = {day: figures for day, figures in live_days.items()}
+            for metas in archived.values():
+                for meta in metas:
+                    _segment_days(archive, meta, days)
+            self.days, self.open = {}, days
+            closed = self.close(through)
+            print(f"📅 สร้างยอดปิดประจำวัน {len(closed)} วัน")
+            return closed
+
+        changed = []
+        for period, metas in archived.items():
+            expected = {'in': {}, 'out': {}}
+            for meta in metas:
+                for item, (kg, amount, count) in meta['items'].items():
+                    _add_figures(expected, meta['mode'], item, kg, amount, count)
+            actual = {'in': {}, 'out': {}}
+            for day, figures in self.days.items():
+                if day.startswith(period):
+                    for mode in ('in', 'out'):
+                        for item, values in figures[mode].items():
+                            _add_figures(actual, mode, item, *values)
+            for day, figures in live_days.items():
+                if day.startswith(period) and self.is_closed(day):
+                    for mode in ('in', 'out'):
+                        for item, values in figures[mode].items():
+                            _add_figures(expected, mode, item, *values)
+            if not _same_figures(expected, actual):
+                days = {day: figures for day, figures in live_days.items() if day.startswith(period)}
+                for meta in metas:
+                    _segment_days(archive, meta, days)
+                for day in sorted(set(days) | {d for d in self.days if d.startswith(period)}):
+                    if self.is_closed(day) and not _same_figures(days.get(day), self.days.get(day)):
+                        self.replace_day(day, days.get(day))
+                        changed.append(day)
+        for day in sorted(set(live_days) | set(self.days)):
+            if day[:7] in archived or not self.is_closed(day):
+                continue
+            if not _same_figures(live_days.get(day), self.days.get(day)):
+                self.replace_day(day, live_days.get(day))
+                changed.append(day)
+        if changed:
+            print(f"🔄 คำนวณยอดปิดประจำวันใหม่ {len(changed)} วัน: {', '.join(changed[:10])}")
+            self.save()
+
+        self.open = {day: figures for day, figures in live_days.items() if not self.is_closed(day)}
+        closed = self.close(through)
+        self.save_open()
+        return closed
+
+    def stock(self):
+        """ยอดรับเข้า/จำหน่ายออกสะสมรายสินค้า = ยอดสิ้นวันที่ปิดล่าสุด + รายการของวันที่ยังเปิด
+        + รายการที่อ่านวันที่ไม่ได้"""
+        last = max(self.days) if self.days else None
+        stock = {item: {'in': values[0], 'out': values[1]}
+                 for item, values in (self.days[last]['closing'] if last else {}).items()}
+        for figures in [*self.open.values(), self.undated]:
+            for mode in ('in', 'out'):
+                for item, (kg, _, _) in figures[mode].items():
+                    stock.setdefault(item, {'in': 0, 'out': 0})[mode] += kg
+        return stock
+
+    def totals(self, start_day, end_day):
+        """ยอดรายสินค้า {โหมด: {สินค้า: [กก., บาท, รายการ]}} ของวันในช่วง [start_day, end_day)"""
+        report = {'in': {}, 'out': {}}
+        for days in (self.days, self.open):
+            for day, figures in days.items():
+                if start_day <= day < end_day:
+                    for mode in ('in', 'out'):
+                        for item, values in figures[mode].items():
+                            _add_figures(report, mode, item, *values)
+        return report
+
+
+# --- สำรองข้อมูลแบบเพิ่มเฉพาะส่วนที่เปลี่ยน ---
+BACKUP_CONFIG_FILE = 'backup.json'
+BACKUP_SOURCES = ('data', 'receipts_in', 'receipts_out', 'prices.json', 'prices.json.backup',
+                  ALERTS_FILE, BACKUP_CONFIG_FILE)
+# ไฟล์ที่สร้างใหม่ได้จากข้อมูลอื่น ไม่ต้องสำรอง
+BACKUP_EXCLUDE = {SNAPSHOT_FILE, os.path.join('data', 'reconcile_cache.bin'),
+                  os.path.join('data', 'consolidation_cache.bin'), DATA_LOCK_FILE}
+BACKUP_CHUNK_SIZE = 1 << 20
+BACKUP_QUARANTINE_DIR = 'restore_quarantine'
+BACKUP_INTERVAL_MINUTES = 60
+
+
+class BackupStore:
+    """ที่เก็บสำรองแบบแยกตามเนื้อหา: objects/<2 ตัวแรก>/<sha256> และ snapshots/<เวลา>.json
+
+    ไฟล์ถูกแบ่งเป็นก้อนละ 1 MiB และเก็บแต่ละก้อนเพียงครั้งเดียวตาม hash จึงไม่คัดลอกใบเสร็จ PDF
+    หรือ segment ที่ไม่เปลี่ยนซ้ำ ไฟล์ที่ขนาดและเวลาแก้ไขตรงกับ snapshot ก่อนหน้าไม่ต้องอ่านใหม่
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.objects_dir = os.path.join(target, 'objects')
+        self.snapshots_dir = os.path.join(target, 'snapshots')
+
+    def snapshots(self):
+        """ชื่อ snapshot ทั้งหมดเรียงจากเก่าไปใหม่"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.snapshots_dir)
+                      if name.endswith('.json'))
+
+    def manifest(self, name):
+        with open(os.path.join(self.snapshots_dir, f"{name}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _put(self, chunk):
+        """เก็บหนึ่งก้อนข้อมูล คืนค่า (hash, จำนวน byte ที่เขียนใหม่)"""
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(chunk, 6)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+        return digest, len(data)
+
+    def _get(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            chunk = zlib.decompress(f.read())
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"ข้อมูลสำรอง {digest} เสียหาย")
+        return chunk
+
+    @staticmethod
+    def source_files(root='.'):
+        """ไฟล์ที่ต้องสำรอง (path แบบสัมพัทธ์กับ root)"""
+        for source in BACKUP_SOURCES:
+            path = os.path.join(root, source)
+            if os.path.isfile(path):
+                yield source
+                continue
+            for folder, _, names in os.walk(path):
+                for name in names:
+                    relpath = os.path.relpath(os.path.join(folder, name), root)
+                    if relpath not in BACKUP_EXCLUDE and not name.endswith('.tmp'):
+                        yield relpath
+
+    def _store_file(self, path):
+        """แบ่งไฟล์เป็นก้อนและเก็บ คืนค่า (รายการ hash, byte ที่เขียนใหม่) หรือ None ถ้าไฟล์เปลี่ยนระหว่างอ่าน"""
+        before = os.stat(path)
+        chunks, written = [], 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b''):
+                digest, size = self._put(chunk)
+                chunks.append(digest)
+                written += size
+        after = os.stat(path)
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+            return None
+        return chunks, written
+
+    def backup(self, root='.'):
+        """สร้าง snapshot ใหม่ของข้อมูลใน root คืนค่าชื่อ snapshot และสถิติ"""
+        names = self.snapshots()
+        previous = self.manifest(names[-1])['files'] if names else {}
+        files, stats = {}, {'files': 0, 'changed': 0, 'bytes': 0}
+        for relpath in self.source_files(root):
+            path = os.path.join(root, relpath)
+            key = relpath.replace(os.sep, '/')
+            try:
+                st = os.stat(path)
+                entry = previous.get(key)
+                if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+                    files[key] = entry
+                    stats['files'] += 1
+                    continue
+                # ไฟล์ที่กำลังถูกเขียนจากหน้าร้าน อ่านใหม่อีกครั้ง ถ้ายังเปลี่ยนอยู่ใช้ของเดิมไปก่อน
+                stored = self._store_file(path) or self._store_file(path)
+            except FileNotFoundError:
+                continue
+            if stored is None:
+                print(f"⚠️ {key} เปลี่ยนระหว่างสำรอง ใช้ข้อมูลจาก snapshot ก่อนหน้า")
+                if entry:
+                    files[key] = entry
+                continue
+            chunks, written = stored
+            files[key] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'chunks': chunks}
+            stats['files'] += 1
+            stats['changed'] += 1
+            stats['bytes'] += written
+
+        name = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        manifest_file = os.path.join(self.snapshots_dir, f"{name}.json")
+        tmp_file = f"{manifest_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'created': datetime.now().strftime(DATE_FORMAT), 'files': files},
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, manifest_file)
+        return name, stats
+
+    def restore(self, name, dest='.'):
+        """ทำให้ไฟล์ที่สำรองไว้ใน dest ตรงกับ snapshot คืนค่า (จำนวนไฟล์ที่เขียน, จำนวนไฟล์ที่ย้ายออก)
+
+        ไฟล์ที่ตรงกันอยู่แล้วไม่เขียนทับ ไฟล์ที่เกิดหลัง snapshot (เช่น ใบเสร็จหรือ segment ใหม่)
+        ย้ายไปไว้ใน restore_quarantine/<snapshot>/ แทนการลบ เผื่อต้องการนำกลับมา
+        ไม่ทำงานขณะที่หน้าร้านเปิดข้อมูลใน dest อยู่ (DataLock)
+        """
+        files = self.manifest(name)['files']
+        with DataLock(dest, f"การกู้คืน snapshot {name} (--restore)"):
+            return self._restore(name, files, dest)
+
+    def _restore(self, name, files, dest):
+        quarantined = 0
+        for relpath in list(self.source_files(dest)):
+            if relpath.replace(os.sep, '/') in files:
+                continue
+            target = os.path.join(dest, BACKUP_QUARANTINE_DIR, name, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(dest, relpath), target)
+            quarantined += 1
+
+        restored = 0
+        for key, entry in files.items():
+            path = os.path.join(dest, *key.split('/'))
+            try:
+                st = os.stat(path)
+                if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime']:
+                    continue
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp_file = f"{path}.tmp"
+            with open(tmp_file, 'wb') as f:
+                for digest in entry['chunks']:
+                    f.write(self._get(digest))
+            os.replace(tmp_file, path)
+            os.utime(path, ns=(entry['mtime'], entry['mtime']))
+            restored += 1
+        return restored, quarantined
+
+
+def load_backup_config(path=BACKUP_CONFIG_FILE):
+    """อ่านโฟลเดอร์ปลายทางและรอบการสำรองอัตโนมัติ เช่น {"target": "D:/scrapshop-backup", "interval_minutes": 60}"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"⚠️ ไม่สามารถอ่าน {path}: {e}")
+        return None
+    if not config.get('target'):
+        return None
+    config.setdefault('interval_minutes', BACKUP_INTERVAL_MINUTES)
+    return config
+
+
+# --- ขั้นตอนคำนวณ/บันทึกรายการ (ใช้ร่วมกันระหว่างหน้าร้านและการทดสอบโหลด) ---
+def prepare_transaction(store, parties, mode, name1, name2, item, price_per_kg, weight, when=None):
+    """ขั้นคำนวณ: ใช้ชื่อเดิมของคู่ค้าที่เคยบันทึก สร้างรายการ และเก็บเป็นรายการรอบันทึก"""
+    name1 = parties[(mode, 'name1')].canonical(name1)
+    name2 = parties[(mode, 'name2')].canonical(name2)
+    data = build_transaction(name1, name2, item, price_per_kg, weight, when)
+    return data, store.append(data, RecordStore.PENDING)
+
+
+def commit_transaction(mode, data, rowid, store, parties, rollups, inventory,
+                       save_ledger, print_receipt, save_history, timings=None):
+    """ขั้นบันทึก: Excel → คู่ค้า/ยอดปิดประจำวัน/คงคลัง → ใบเสร็จ PDF → ประวัติใบเสร็จ
+
+    save_ledger(data) คืนค่า True เมื่อบันทึก Excel สำเร็จ, print_receipt(data) คืนชื่อไฟล์ PDF
+    (หรือ None) และ save_history(data, filename) บันทึกประวัติใบเสร็จ ถ้าส่ง timings มา
+    จะเก็บเวลาของแต่ละขั้น (persist, parties, rollups, inventory, render, history) เป็นวินาที
+    คืนค่า (row id, ชื่อไฟล์ PDF, บันทึก Excel สำเร็จหรือไม่)
+    """
+    clock = time.perf_counter
+    started = [clock()]
+
+    def lap(stage):
+        now = clock()
+        if timings is not None:
+            timings[stage] = now - started[0]
+        started[0] = now
+
+    if rowid is None or not store.flags[rowid] & RecordStore.PENDING:
+        # บันทึกซ้ำหลังบันทึกไปแล้ว ให้เป็นรายการใหม่เหมือนแถวใหม่ใน Excel
+        rowid = store.append(data, 0)
+
+    saved = save_ledger(data)
+    lap('persist')
+    if saved:
+        store.mark_ledger(rowid)
+        for column, name in (('name1', data[1]), ('name2', data[2])):
+            parties[(mode, column)].record(name, data[3], data[4], store.ts[rowid])
+    lap('parties')
+    if saved:
+        # รายการที่ลงวันที่ซึ่งปิดยอดไปแล้วจะคำนวณใหม่เฉพาะวันนั้น
+        if rollups.add(mode, store.ts[rowid], data[3], data[5], data[6]):
+            rollups.save()
+        else:
+            rollups.save_open()
+    lap('rollups')
+    if saved:
+        # อัปเดตสินค้าคงคลังเฉพาะรายการนี้แทนการสแกนไฟล์ใหม่
+        inventory.apply(mode, data[3], data[5])
+    lap('inventory')
+
+    filename = print_receipt(data)
+    lap('render')
+    if filename:
+        save_history(data, filename)
+        store.set_file(rowid, filename)
+    lap('history')
+    return rowid, filename, saved
+
+
+def render_receipt_pdf(filename, data, mode, font_name):
+    """วาดใบเสร็จ PDF ของหนึ่งรายการลงไฟล์ (ฝังข้อมูลรายการไว้ใน Keywords)"""
+    date, name1, name2, item, price_per_kg, weight, total = data
+
+    # สร้าง PDF
+    c = canvas.Canvas(filename, pagesize=letter)
+    width, height = letter
+    c.setKeywords(RECEIPT_META_PREFIX + base64.b64encode(json.dumps(
+        [mode, *data], ensure_ascii=False).encode('utf-8')).decode('ascii'))
+
+    try:
+        c.setFont(font_name, 20)
+    except:
+        c.setFont('Helvetica', 20)
+        print("⚠️ ไม่สามารถใช้ฟอนต์ไทยได้ ใช้ Helvetica แทน")
+
+    title = "ใบเสร็จรับซื้อของเก่า" if mode == 'in' else "ใบเสร็จจำหน่ายของเก่า"
+    title_width = c.stringWidth(title, font_name, 20)
+    c.drawString((width - title_width) / 2, height - 100, title)
+
+    y_position = height - 150
+    line_height = 25
+
+    try:
+        c.setFont(font_name, 16)
+    except:
+        c.setFont('Helvetica', 16)
+
+    label1 = "ผู้ขาย:" if mode == 'in' else "ผู้จ่าย:"
+    lines = [
+        f"{label1} {name1}",
+        f"ผู้รับ: {name2}",
+        f"สินค้า: {item}",
+        f"ราคาต่อหน่วย: {price_per_kg:,.2f} บาท/กก.",
+        f"น้ำหนัก: {weight:,.2f} กก.",
+    ]
+
+    for line in lines:
+        c.drawString(100, y_position, line)
+        y_position -= line_height
+
+    c.line(100, y_position - 10, width - 100, y_position - 10)
+    y_position -= 30
+
+    try:
+        c.setFont(font_name, 18)
+    except:
+        c.setFont('Helvetica-Bold', 18)
+
+    total_text = f"รวมทั้งสิ้น: {total:,.2f} บาท"
+    c.drawString(100, y_position, total_text)
+
+    c.line(100, y_position - 20, width - 100, y_position - 20)
+    y_position -= 40
+
+    try:
+        c.setFont(font_name, 14)
+    except:
+        c.setFont('Helvetica', 14)
+
+    c.drawString(100, y_position, f"วันที่: {date}")
+
+    y_position -= 80
+    c.drawString(100, y_position,
+                 "ลายเซ็นผู้รับ: _____________________")
+    c.drawString(350, y_position,
+                 "ลายเซ็นผู้จ่าย: _____________________")
+
+    c.save()
+
 
 class ScrapShopApp:
     def __init__(self, root):
@@ -51,6 +1722,9 @@ class ScrapShopApp:
         self.notebook = ctk.CTkTabview(main_frame, width=800, height=600)
         self.notebook.pack(fill=ctk.BOTH, expand=True, padx=10, pady=10)
 
+        # Sortable/filterable views over the record store, filled by the tab setup
+        self.table_views = {}
+
         # Setup Tabs
         self.incoming_tab = self.notebook.add("รับเข้า")
         self.outgoing_tab = self.notebook.add("จำหน่ายออก")
@@ -73,23 +1747,53 @@ class ScrapShopApp:
             'data', 'outgoing_scrap_records.xlsx')
         self.receipt_history_file = os.path.join(
             'data', 'receipt_history.json')
+        self.archive = ArchiveStore(ARCHIVE_DIR)
 
         if not os.path.exists(self.incoming_excel):
             self.create_excel_file(self.incoming_excel)
         if not os.path.exists(self.outgoing_excel):
             self.create_excel_file(self.outgoing_excel)
 
-        # Load histories
-        self.load_excel_history(self.incoming_excel, self.incoming_calc_tree)
-        self.load_excel_history(self.outgoing_excel, self.outgoing_calc_tree)
-        self.load_receipt_history()
-
-        # Compute inventory
-        self.compute_inventory()
+        # Derived state: one record store per mode shared by all tables
+        thresholds, alert_sinks = load_alert_config()
+        self.inventory = Inventory(thresholds=thresholds)
+        self.inventory.subscribe(self._show_stock_alert)
+        for sink in alert_sinks:
+            self.inventory.subscribe(sink)
+        self.stores = {'in': RecordStore(), 'out': RecordStore()}
+        self.rollups = DailyRollups(ROLLUPS_FILE, {'in': self.incoming_excel,
+                                                   'out': self.outgoing_excel})
+        self.parties = {(mode, column): PartyDirectory()
+                        for mode in ('in', 'out') for column in ('name1', 'name2')}
+        self._snapshot_dirty = False
+        self._snapshot_thread = None
+
+        # Load histories (snapshot first, full rebuild if the files changed)
+        started = time.perf_counter()
+        if self.load_snapshot():
+            print(
+                f"⚡ โหลดสถานะจาก snapshot: {time.perf_counter() - started:.3f} วินาที")
+        else:
+            self.rebuild_state()
+            print(
+                f"🔄 สร้างสถานะใหม่จากไฟล์: {time.perf_counter() - started:.3f} วินาที")
+            self.root.after_idle(self.save_snapshot)
 
         # Current data
         self.current_in_data = None
         self.current_out_data = None
+        self.current_rows = {'in': None, 'out': None}
+
+        # ปิดยอดวันก่อนหน้าที่ยังไม่ได้ปิดเมื่อเปิดโปรแกรมครั้งแรกของวัน
+        self.close_days((datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
+
+        # Periodic checkpoints and a final snapshot at shutdown
+        self.root.after(SNAPSHOT_INTERVAL_MS, self._checkpoint_snapshot)
+        self.backup_config = load_backup_config()
+        self._backup_thread = None
+        if self.backup_config:
+            self.root.after(60 * 1000, self._schedule_backup)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def load_prices(self):
         """โหลดราคาจากไฟล์ JSON พร้อมการจัดการข้อผิดพลาด"""
@@ -241,23 +1945,7 @@ class ScrapShopApp:
     def register_thai_font(self):
         """ลงทะเบียนฟอนต์ภาษาไทยสำหรับ PDF"""
         try:
-            # ลำดับการค้นหาไฟล์ฟอนต์
-            font_paths = [
-                os.path.join(os.path.dirname(os.path.abspath(
-                    __file__)), "TH Sarabun New Bold.ttf"),
-                os.path.join(os.path.dirname(os.path.abspath(
-                    __file__)), "THSarabunNew Bold.ttf"),
-                os.path.join(os.path.dirname(os.path.abspath(
-                    __file__)), "fonts", "TH Sarabun New Bold.ttf"),
-                "C:/Windows/Fonts/THSarabunNew Bold.ttf",
-                "C:/Windows/Fonts/TH Sarabun New Bold.ttf",
-                "/usr/share/fonts/truetype/thai/TH Sarabun New Bold.ttf",
-                "/usr/local/share/fonts/TH Sarabun New Bold.ttf",
-                "/System/Library/Fonts/TH Sarabun New Bold.ttf",
-                "/Library/Fonts/TH Sarabun New Bold.ttf"
-            ]
-
-            for font_path in font_paths:
+            for font_path in THAI_FONT_PATHS:
                 if os.path.exists(font_path):
                     try:
                         pdfmetrics.registerFont(TTFont('THSarabun', font_path))
@@ -292,14 +1980,16 @@ class ScrapShopApp:
         ctk.CTkLabel(input_frame, text=label1_text, font=("TH Sarabun New", 18)).grid(
             row=0, column=0, padx=10, pady=10, sticky="w")
         name1_var = tk.StringVar()
-        ctk.CTkEntry(input_frame, textvariable=name1_var, width=300, font=(
-            "TH Sarabun New", 18)).grid(row=0, column=1, padx=10, pady=10, sticky="ew")
+        name1_entry = ctk.CTkEntry(input_frame, textvariable=name1_var, width=300, font=(
+            "TH Sarabun New", 18))
+        name1_entry.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
 
         ctk.CTkLabel(input_frame, text=label2_text, font=("TH Sarabun New", 18)).grid(
             row=1, column=0, padx=10, pady=10, sticky="w")
         name2_var = tk.StringVar()
-        ctk.CTkEntry(input_frame, textvariable=name2_var, width=300, font=(
-            "TH Sarabun New", 18)).grid(row=1, column=1, padx=10, pady=10, sticky="ew")
+        name2_entry = ctk.CTkEntry(input_frame, textvariable=name2_var, width=300, font=(
+            "TH Sarabun New", 18))
+        name2_entry.grid(row=1, column=1, padx=10, pady=10, sticky="ew")
 
         ctk.CTkLabel(input_frame, text="เลือกสินค้า:", font=("TH Sarabun New", 18)).grid(
             row=2, column=0, padx=10, pady=10, sticky="w")
@@ -345,30 +2035,43 @@ class ScrapShopApp:
                            expand=True, padx=10, pady=10)
 
         if mode == 'in':
-            ctk.CTkLabel(history_frame, text="📊 สินค้ารับเข้า", font=(
-                "TH Sarabun New", 20, "bold")).pack(anchor="w")
-            self.incoming_calc_tree = ttk.Treeview(history_frame, columns=(
-                "date", "seller", "buyer", "item", "price", "weight", "total"), show="headings", height=10)
-            for col, text in zip(("date", "seller", "buyer", "item", "price", "weight", "total"), ("วันที่", "ผู้ขาย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม")):
-                self.incoming_calc_tree.heading(col, text=text)
+            header, filter_var = self._table_header(history_frame, "📊 สินค้ารับเข้า")
+            header.pack(fill=ctk.X)
+            columns = ("date", "seller", "buyer", "item", "price", "weight", "total")
+            headings = ("วันที่", "ผู้ขาย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม")
+            self.incoming_calc_tree = ttk.Treeview(
+                history_frame, columns=columns, show="headings", height=10)
+            for col in columns:
                 self.incoming_calc_tree.column(col, width=150, anchor="center")
             self.incoming_calc_tree.pack(fill=ctk.BOTH, expand=True, pady=5)
+            self.table_views['calc_in'] = self._table_view(
+                self.incoming_calc_tree, columns, headings, 'calc', filter_var)
             self.seller_var, self.buyer_var = name1_var, name2_var
             self.item_in_var, self.price_in_var, self.weight_in_var = item_var, price_var, weight_var
             self.save_print_in_button, self.result_in_label = save_print_button, result_label
         else:  # mode == 'out'
-            ctk.CTkLabel(history_frame, text="📊 สินค้าจำหน่ายออก", font=(
-                "TH Sarabun New", 20, "bold")).pack(anchor="w")
-            self.outgoing_calc_tree = ttk.Treeview(history_frame, columns=(
-                "date", "payer", "recipient", "item", "price", "weight", "total"), show="headings", height=10)
-            for col, text in zip(("date", "payer", "recipient", "item", "price", "weight", "total"), ("วันที่", "ผู้จ่าย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม")):
-                self.outgoing_calc_tree.heading(col, text=text)
+            header, filter_var = self._table_header(history_frame, "📊 สินค้าจำหน่ายออก")
+            header.pack(fill=ctk.X)
+            columns = ("date", "payer", "recipient", "item", "price", "weight", "total")
+            headings = ("วันที่", "ผู้จ่าย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม")
+            self.outgoing_calc_tree = ttk.Treeview(
+                history_frame, columns=columns, show="headings", height=10)
+            for col in columns:
                 self.outgoing_calc_tree.column(col, width=150, anchor="center")
             self.outgoing_calc_tree.pack(fill=ctk.BOTH, expand=True, pady=5)
+            self.table_views['calc_out'] = self._table_view(
+                self.outgoing_calc_tree, columns, headings, 'calc', filter_var)
             self.payer_var, self.recipient_var = name1_var, name2_var
             self.item_out_var, self.price_out_var, self.weight_out_var = item_var, price_var, weight_var
             self.save_print_out_button, self.result_out_label = save_print_button, result_label
 
+        # เติมชื่ออัตโนมัติจากรายชื่อคู่ค้า เลือกลูกค้าประจำแล้วโหลดสินค้า/ราคาล่าสุด
+        self._attach_autocomplete(
+            input_frame, name1_entry, name1_var, mode, 'name1',
+            lambda name: self._preload_last_item(mode, name, item_var, price_var))
+        self._attach_autocomplete(
+            input_frame, name2_entry, name2_var, mode, 'name2')
+
         # ตั้งค่าค่าเริ่มต้นของสินค้าและราคา
         if prices and len(prices) > 0:
             first_item = list(prices.keys())[0]
@@ -380,6 +2083,74 @@ class ScrapShopApp:
         else:
             print("⚠️ ไม่มีราคาให้ตั้งค่าเริ่มต้น")
 
+    def _attach_autocomplete(self, parent, entry, var, mode, column, on_select=None):
+        """แสดงรายชื่อแนะนำใต้ช่องกรอกชื่อขณะพิมพ์"""
+        listbox = tk.Listbox(parent, height=6, font=("TH Sarabun New", 16),
+                             exportselection=False)
+
+        def hide(event=None):
+            listbox.place_forget()
+
+        def choose(event=None):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            name = listbox.get(selection[0])
+            var.set(name)
+            hide()
+            entry.focus_set()
+            entry.icursor(tk.END)
+            if on_select:
+                on_select(name)
+            return "break"
+
+        def update(event):
+            if event.keysym in ("Down", "Up", "Return", "Escape", "Tab"):
+                return
+            suggestions = self.parties[(mode, column)].suggest(var.get())
+            if not suggestions or suggestions == [var.get().strip()]:
+                hide()
+                return
+            listbox.delete(0, tk.END)
+            for name in suggestions:
+                listbox.insert(tk.END, name)
+            listbox.configure(height=len(suggestions))
+            listbox.place(in_=entry, relx=0, rely=1.0, relwidth=1.0)
+            listbox.lift()
+
+        def move_down(event):
+            if listbox.winfo_ismapped():
+                listbox.focus_set()
+                listbox.selection_clear(0, tk.END)
+                listbox.selection_set(0)
+                listbox.activate(0)
+                return "break"
+
+        def leave(event):
+            # รอให้การคลิกที่รายการทำงานก่อนซ่อน
+            self.root.after(150, lambda: hide() if self.root.focus_get() != listbox else None)
+
+        entry.bind("<KeyRelease>", update, add="+")
+        entry.bind("<Down>", move_down, add="+")
+        entry.bind("<Escape>", hide, add="+")
+        entry.bind("<FocusOut>", leave, add="+")
+        listbox.bind("<Return>", choose)
+        listbox.bind("<Double-Button-1>", choose)
+        listbox.bind("<ButtonRelease-1>", choose)
+        listbox.bind("<Escape>", lambda event: (hide(), entry.focus_set()))
+        listbox.bind("<FocusOut>", hide)
+
+    def _preload_last_item(self, mode, name, item_var, price_var):
+        """โหลดสินค้าและราคาที่ลูกค้าประจำใช้ครั้งล่าสุด"""
+        found = self.parties[(mode, 'name1')].lookup(name)
+        if not found or not found[1]:
+            return
+        _, item, price = found
+        item_var.set(item)
+        if price:
+            price_var.set(price)
+        print(f"👤 โหลดรายการล่าสุดของ {name}: {item} {price} บาท/กก.")
+
     def setup_history_tab(self):
         tables_frame = ctk.CTkFrame(self.history_tab, fg_color="transparent")
         tables_frame.pack(fill=ctk.BOTH, expand=True)
@@ -387,35 +2158,71 @@ class ScrapShopApp:
         tables_frame.grid_columnconfigure(0, weight=1)
 
         # Receipt In History
-        ctk.CTkLabel(tables_frame, text="🧾 ประวัติใบเสร็จรับเข้า", font=(
-            "TH Sarabun New", 20, "bold")).grid(row=0, column=0, sticky="w", pady=(10, 0))
-        self.receipt_in_tree = ttk.Treeview(tables_frame, columns=(
-            "date", "seller", "buyer", "item", "price", "weight", "total", "file"), show="headings", height=6)
-        for col, text in zip(("date", "seller", "buyer", "item", "price", "weight", "total", "file"), ("วันที่", "ผู้ขาย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม", "ไฟล์ PDF")):
-            self.receipt_in_tree.heading(col, text=text)
+        header, filter_var = self._table_header(
+            tables_frame, "🧾 ประวัติใบเสร็จรับเข้า")
+        header.grid(row=0, column=0, sticky="ew", pady=(10, 0))
+        columns = ("date", "seller", "buyer", "item", "price", "weight", "total", "file")
+        headings = ("วันที่", "ผู้ขาย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม", "ไฟล์ PDF")
+        self.receipt_in_tree = ttk.Treeview(
+            tables_frame, columns=columns, show="headings", height=6)
+        for col in columns:
             self.receipt_in_tree.column(col, width=150, anchor="center")
         self.receipt_in_tree.grid(row=1, column=0, sticky="nsew", pady=5)
+        self.table_views['receipt_in'] = self._table_view(
+            self.receipt_in_tree, columns, headings, 'receipt', filter_var)
 
         # Receipt Out History
-        ctk.CTkLabel(tables_frame, text="🧾 ประวัติใบเสร็จจำหน่ายออก", font=(
-            "TH Sarabun New", 20, "bold")).grid(row=2, column=0, sticky="w", pady=(20, 0))
-        self.receipt_out_tree = ttk.Treeview(tables_frame, columns=(
-            "date", "payer", "recipient", "item", "price", "weight", "total", "file"), show="headings", height=6)
-        for col, text in zip(("date", "payer", "recipient", "item", "price", "weight", "total", "file"), ("วันที่", "ผู้จ่าย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม", "ไฟล์ PDF")):
-            self.receipt_out_tree.heading(col, text=text)
+        header, filter_var = self._table_header(
+            tables_frame, "🧾 ประวัติใบเสร็จจำหน่ายออก")
+        header.grid(row=2, column=0, sticky="ew", pady=(20, 0))
+        columns = ("date", "payer", "recipient", "item", "price", "weight", "total", "file")
+        headings = ("วันที่", "ผู้จ่าย", "ผู้รับ", "สินค้า", "ราคา/กก.", "น้ำหนัก", "รวม", "ไฟล์ PDF")
+        self.receipt_out_tree = ttk.Treeview(
+            tables_frame, columns=columns, show="headings", height=6)
+        for col in columns:
             self.receipt_out_tree.column(col, width=150, anchor="center")
         self.receipt_out_tree.grid(row=3, column=0, sticky="nsew", pady=5)
+        self.table_views['receipt_out'] = self._table_view(
+            self.receipt_out_tree, columns, headings, 'receipt', filter_var)
 
         # Inventory
-        ctk.CTkLabel(tables_frame, text="📦 สินค้าคงคลัง", font=(
-            "TH Sarabun New", 20, "bold")).grid(row=4, column=0, sticky="w", pady=(20, 0))
+        header = ctk.CTkFrame(tables_frame, fg_color="transparent")
+        header.grid(row=4, column=0, sticky="ew", pady=(20, 0))
+        ctk.CTkLabel(header, text="📦 สินค้าคงคลัง", font=(
+            "TH Sarabun New", 20, "bold")).pack(side=ctk.LEFT)
+        ctk.CTkButton(header, text="📅 ปิดยอดวันนี้", command=self.close_today, font=(
+            "TH Sarabun New", 16)).pack(side=ctk.RIGHT)
         self.inventory_tree = ttk.Treeview(tables_frame, columns=(
             "item", "total_in", "total_out", "stock"), show="headings", height=6)
         for col, text in zip(("item", "total_in", "total_out", "stock"), ("สินค้า", "รวมรับเข้า", "รวมจำหน่ายออก", "คงคลัง")):
             self.inventory_tree.heading(col, text=text)
             self.inventory_tree.column(col, width=150, anchor="center")
+        self.inventory_tree.tag_configure("negative", foreground="red")
+        self.inventory_tree.tag_configure("above", foreground="green")
         self.inventory_tree.grid(row=5, column=0, sticky="nsew", pady=5)
 
+        self.stock_alert_label = ctk.CTkLabel(tables_frame, text="", font=(
+            "TH Sarabun New", 18, "bold"), text_color="red")
+        self.stock_alert_label.grid(row=6, column=0, sticky="w")
+
+    def _table_header(self, parent, title):
+        """แถบหัวตาราง: ชื่อตารางด้านซ้าย ช่องค้นหาด้านขวา"""
+        header = ctk.CTkFrame(parent, fg_color="transparent")
+        ctk.CTkLabel(header, text=title, font=(
+            "TH Sarabun New", 20, "bold")).pack(side=ctk.LEFT)
+        filter_var = tk.StringVar()
+        ctk.CTkEntry(header, textvariable=filter_var, width=250, font=(
+            "TH Sarabun New", 16)).pack(side=ctk.RIGHT, padx=(5, 0))
+        ctk.CTkLabel(header, text="🔍 ค้นหา:", font=(
+            "TH Sarabun New", 16)).pack(side=ctk.RIGHT)
+        return header, filter_var
+
+    def _table_view(self, tree, columns, headings, view, filter_var):
+        table_view = TableView(self.root, tree, columns, headings, view)
+        filter_var.trace_add(
+            "write", lambda *args: table_view.schedule_filter(filter_var.get()))
+        return table_view
+
     def validate_numeric(self, new_value):
         if new_value == "":
             return True
@@ -462,37 +2269,29 @@ class ScrapShopApp:
     def create_excel_file(self, excel_file):
         """สร้างไฟล์ Excel ใหม่"""
         try:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Records"
-            ws.append(["วันที่", "ชื่อผู้ขาย/ผู้จ่าย", "ชื่อผู้รับ",
-                      "สินค้า", "ราคา/กก.", "น้ำหนัก (กก.)", "รวม (บาท)"])
-            wb.save(excel_file)
+            create_ledger_file(excel_file)
             print(f"✅ สร้างไฟล์ Excel ใหม่: {excel_file}")
         except Exception as e:
             print(f"❌ ไม่สามารถสร้างไฟล์ Excel ได้: {e}")
             messagebox.showerror(
                 "เกิดข้อผิดพลาด", f"ไม่สามารถสร้างไฟล์ Excel ได้: {e}")
 
-    def load_excel_history(self, excel_file, tree):
+    def load_excel_history(self, excel_file):
         """โหลดประวัติจากไฟล์ Excel"""
+        rows = []
         if os.path.exists(excel_file):
             try:
-                wb = load_workbook(excel_file, read_only=True)
-                ws = wb.active
-                row_count = 0
-                for row in ws.iter_rows(min_row=2, values_only=True):
-                    if row[0] is not None:  # ตรวจสอบว่าแถวไม่ว่าง
-                        tree.insert("", "end", values=row)
-                        row_count += 1
-                print(f"📊 โหลดประวัติจาก {excel_file}: {row_count} รายการ")
+                rows = read_ledger_rows(excel_file)
+                print(f"📊 โหลดประวัติจาก {excel_file}: {len(rows)} รายการ")
             except Exception as e:
                 print(f"❌ ไม่สามารถโหลดประวัติจาก Excel ได้: {e}")
                 messagebox.showwarning(
                     "ข้อผิดพลาดในการโหลด", f"ไม่สามารถโหลดประวัติจาก Excel: {e}")
+        return rows
 
     def load_receipt_history(self):
         """โหลดประวัติใบเสร็จจากไฟล์ JSON"""
+        history = {'in': [], 'out': []}
         try:
             if os.path.exists(self.receipt_history_file):
                 with open(self.receipt_history_file, 'r', encoding='utf-8') as f:
@@ -500,14 +2299,6 @@ class ScrapShopApp:
 
                 in_count = len(history.get('in', []))
                 out_count = len(history.get('out', []))
-
-                for record in history.get('in', []):
-                    self.receipt_in_tree.insert(
-                        "", "end", values=tuple(record))
-                for record in history.get('out', []):
-                    self.receipt_out_tree.insert(
-                        "", "end", values=tuple(record))
-
                 print(
                     f"📋 โหลดประวัติใบเสร็จ: รับเข้า {in_count} รายการ, จำหน่าย {out_count} รายการ")
             else:
@@ -517,23 +2308,183 @@ class ScrapShopApp:
             print(f"⚠️ ไม่สามารถโหลดประวัติใบเสร็จได้: {e}")
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการโหลดประวัติใบเสร็จ: {e}")
+        return history
+
+    def rebuild_state(self):
+        """อ่านไฟล์ Excel และ JSON ทั้งหมดใหม่ (อ่านแต่ละไฟล์เพียงครั้งเดียว)"""
+        history = self.load_receipt_history()
+        for mode, excel_file in (('in', self.incoming_excel), ('out', self.outgoing_excel)):
+            store = RecordStore()
+            store.load(self.load_excel_history(excel_file), history.get(mode, []))
+            self.stores[mode] = store
+
+        self.render_history()
+        undated = {'in': {}, 'out': {}}
+        self.rollups.sync(group_by_day(self.stores, undated=undated), self.archive,
+                          (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), undated)
+        self.compute_inventory()
+        for (mode, column), directory in self.parties.items():
+            directory.build(self.stores[mode], column)
+
+    def render_history(self):
+        """แสดงหน้าล่าสุดของทุกตารางจาก record store"""
+        for key, view in self.table_views.items():
+            view.attach(self.stores[key.split('_')[1]])
+
+    def _snapshot_sources(self):
+        return (self.incoming_excel, self.outgoing_excel, self.receipt_history_file,
+                self.archive.manifest_file, self.rollups.path)
+
+    def save_snapshot(self, background=True):
+        """บันทึกสถานะที่คำนวณแล้วลงไฟล์ snapshot สำหรับการเปิดโปรแกรมครั้งถัดไป
+
+        บน UI thread ทำแค่สำเนาคอลัมน์และ pickle ข้อมูลขนาดเล็ก ส่วนการ dump/บีบอัด/เขียนไฟล์
+        ทำใน thread แยกเพื่อไม่ให้หน้าร้านหยุดรอ
+        """
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return  # ยังบันทึกรอบก่อนไม่เสร็จ checkpoint ถัดไปจะบันทึกอีกครั้ง
+        try:
+            captured = {
+                'stats': {path: _stat_key(path) for path in self._snapshot_sources()},
+                'stores': {mode: store.copy() for mode, store in self.stores.items()},
+                'state': pickle.dumps({
+                    'inventory': self.inventory.stock,
+                    'rollups_open': self.rollups.open,
+                    'rollups_undated': self.rollups.undated,
+                    'parties': {key: directory.dump() for key, directory in self.parties.items()},
+                }, protocol=pickle.HIGHEST_PROTOCOL),
+            }
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถบันทึก snapshot ได้: {e}")
+            return
+        self._snapshot_dirty = False
+        if background:
+            self._snapshot_thread = threading.Thread(
+                target=self._write_snapshot, args=(captured,), daemon=True)
+            self._snapshot_thread.start()
+        else:
+            self._write_snapshot(captured)
 
-    def save_receipt_history(self, mode, data, filename):
-        """บันทึกประวัติใบเสร็จ"""
-        history = {'in': [], 'out': []}
+    def _write_snapshot(self, captured):
         try:
-            if os.path.exists(self.receipt_history_file):
-                with open(self.receipt_history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("📝 สร้างไฟล์ประวัติใบเสร็จใหม่")
+            fingerprints = {}
+            for path, stat in captured['stats'].items():
+                fingerprint = file_fingerprint(path)
+                if (fingerprint and fingerprint[:2]) != stat or _stat_key(path) != stat:
+                    raise RuntimeError(f"ไฟล์ {path} เปลี่ยนระหว่างบันทึก")
+                fingerprints[path] = fingerprint
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'fingerprints': fingerprints,
+                'stores': {mode: store.dump() for mode, store in captured['stores'].items()},
+                'state': captured['state'],
+            }
+            payload = zlib.compress(pickle.dumps(
+                snapshot, protocol=pickle.HIGHEST_PROTOCOL), 1)
+            tmp_file = f"{SNAPSHOT_FILE}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_file, SNAPSHOT_FILE)
+            print(f"💾 บันทึก snapshot สำเร็จ: {len(payload)} bytes")
+        except Exception as e:
+            self._snapshot_dirty = True
+            print(f"⚠️ ไม่สามารถบันทึก snapshot ได้: {e}")
 
-        record = list(data) + [filename]
-        history[mode].append(record)
+    def load_snapshot(self):
+        """โหลดสถานะจาก snapshot ถ้า fingerprint ของไฟล์ต้นทางยังตรงกัน"""
+        if not os.path.exists(SNAPSHOT_FILE):
+            return False
+        try:
+            with open(SNAPSHOT_FILE, 'rb') as f:
+                snapshot = pickle.loads(zlib.decompress(f.read()))
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                print("⚠️ snapshot คนละเวอร์ชัน จะสร้างสถานะใหม่")
+                return False
+            fingerprints = snapshot['fingerprints']
+            for path in self._snapshot_sources():
+                if not fingerprint_matches(path, fingerprints.get(path)):
+                    print(f"🔄 ไฟล์ {path} เปลี่ยนแปลง จะสร้างสถานะใหม่")
+                    return False
+            stores = {mode: RecordStore.restore(data)
+                      for mode, data in snapshot['stores'].items()}
+            state = pickle.loads(snapshot['state'])
+            parties = {key: PartyDirectory.restore(data)
+                       for key, data in state['parties'].items()}
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถอ่าน snapshot ได้: {e}")
+            return False
 
+        self.stores = stores
+        self.parties = parties
+        self.render_history()
+        self.rollups.open = state['rollups_open']
+        self.rollups.undated = state['rollups_undated']
+        self.rollups.save_open()
+        self.inventory.stock = state['inventory']
+        self._render_inventory()
+        return True
+
+    def _checkpoint_snapshot(self):
+        """checkpoint เป็นระยะ บันทึกเฉพาะเมื่อสถานะเปลี่ยน"""
+        if self._snapshot_dirty:
+            self.save_snapshot()
+        self.root.after(SNAPSHOT_INTERVAL_MS, self._checkpoint_snapshot)
+
+    def close_days(self, through):
+        """ปิดยอดประจำวันถึงวัน through แล้วบันทึก snapshot ให้ตรงกับไฟล์ยอดปิด"""
+        try:
+            closed = self.rollups.close(through)
+        except Exception as e:
+            print(f"❌ ไม่สามารถปิดยอดประจำวันได้: {e}")
+            messagebox.showerror("เกิดข้อผิดพลาด", f"ไม่สามารถปิดยอดประจำวัน: {e}")
+            return []
+        if closed:
+            print(f"📅 ปิดยอดประจำวัน: {', '.join(closed)}")
+        self._snapshot_dirty = True
+        return closed
+
+    def close_today(self):
+        """ปิดยอดของวันนี้ด้วยตนเอง (รายการที่บันทึกหลังจากนี้จะปรับยอดของวันที่ปิดแล้ว)"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        self.close_days(today)
+        totals = self.rollups.totals(today, '9999-12-31')
+        lines = [f"{title}: {sum(v[0] for v in totals[mode].values()):,.2f} กก. "
+                 f"{sum(v[1] for v in totals[mode].values()):,.2f} บาท "
+                 f"({sum(v[2] for v in totals[mode].values())} รายการ)"
+                 for mode, title in (('in', "รับเข้า"), ('out', "จำหน่ายออก"))]
+        messagebox.showinfo("ปิดยอดประจำวัน",
+                            f"ปิดยอดวันที่ {datetime.now().strftime('%d/%m/%Y')} แล้ว\n" + "\n".join(lines))
+
+    def _schedule_backup(self):
+        """เริ่มสำรองข้อมูลใน thread แยกเพื่อไม่ให้หน้าร้านต้องหยุดรอ แล้วตั้งรอบถัดไป"""
+        if self._backup_thread is None or not self._backup_thread.is_alive():
+            self._backup_thread = threading.Thread(target=self._run_backup, daemon=True)
+            self._backup_thread.start()
+        self.root.after(int(self.backup_config['interval_minutes'] * 60 * 1000),
+                        self._schedule_backup)
+
+    def _run_backup(self):
+        target = self.backup_config['target']
         try:
-            with open(self.receipt_history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=4)
+            name, stats = BackupStore(target).backup()
+            print(f"💾 สำรองข้อมูล {name} ไปที่ {target}: {stats['files']} ไฟล์ "
+                  f"(เปลี่ยน {stats['changed']}, เขียนใหม่ {stats['bytes']:,} bytes)")
+        except Exception as e:
+            print(f"❌ สำรองข้อมูลไปที่ {target} ไม่สำเร็จ: {e}")
+
+    def on_close(self):
+        """บันทึก snapshot ก่อนปิดโปรแกรม"""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        if self._snapshot_dirty:
+            self.save_snapshot(background=False)
+        self.root.destroy()
+
+    def save_receipt_history(self, mode, data, filename):
+        """บันทึกประวัติใบเสร็จ"""
+        try:
+            append_receipt_history(
+                self.receipt_history_file, mode, list(data) + [filename])
             print(f"✅ บันทึกประวัติใบเสร็จสำเร็จ: {mode}")
         except Exception as e:
             print(f"❌ ไม่สามารถบันทึกประวัติใบเสร็จได้: {e}")
@@ -542,52 +2493,38 @@ class ScrapShopApp:
 
     def compute_inventory(self):
         """คำนวณสินค้าคงคลัง"""
-        stock = {}
+        # ยอดสิ้นวันที่ปิดล่าสุดรวมกับรายการของวันที่ยังเปิด ไม่ต้องรวมทุกรายการใหม่
+        self.inventory.stock = self.rollups.stock()
+        self._render_inventory()
 
-        # นับสินค้ารับเข้า
-        if os.path.exists(self.incoming_excel):
-            try:
-                wb_in = load_workbook(self.incoming_excel, read_only=True)
-                ws_in = wb_in.active
-                for row in ws_in.iter_rows(min_row=2, values_only=True):
-                    if row[0] is None:
-                        continue
-                    _, _, _, item, _, weight, _ = row
-                    if item and weight:
-                        if item not in stock:
-                            stock[item] = {'in': 0, 'out': 0}
-                        stock[item]['in'] += float(weight)
-            except Exception as e:
-                print(f"❌ ไม่สามารถอ่านไฟล์รับเข้าได้: {e}")
-
-        # นับสินค้าจำหน่ายออก
-        if os.path.exists(self.outgoing_excel):
-            try:
-                wb_out = load_workbook(self.outgoing_excel, read_only=True)
-                ws_out = wb_out.active
-                for row in ws_out.iter_rows(min_row=2, values_only=True):
-                    if row[0] is None:
-                        continue
-                    _, _, _, item, _, weight, _ = row
-                    if item and weight:
-                        if item not in stock:
-                            stock[item] = {'in': 0, 'out': 0}
-                        stock[item]['out'] += float(weight)
-            except Exception as e:
-                print(f"❌ ไม่สามารถอ่านไฟล์จำหน่ายออกได้: {e}")
+        print(f"📦 คำนวณสินค้าคงคลัง: {len(self.inventory.stock)} รายการ")
 
-        # อัปเดต inventory tree
+    def _render_inventory(self):
+        """อัปเดต inventory tree จากยอดสะสมในหน่วยความจำ"""
         self.inventory_tree.delete(*self.inventory_tree.get_children())
-        for item, data in sorted(stock.items()):
+        for item, data in sorted(self.inventory.stock.items()):
             remaining = data['in'] - data['out']
+            high = self.inventory.thresholds.get(item, {}).get('high')
+            if remaining < 0:
+                tags = ("negative",)
+            elif high is not None and remaining >= high:
+                tags = ("above",)
+            else:
+                tags = ()
             self.inventory_tree.insert("", "end", values=(
                 item,
                 f"{data['in']:.2f}",
                 f"{data['out']:.2f}",
                 f"{remaining:.2f}"
-            ))
+            ), tags=tags)
 
-        print(f"📦 คำนวณสินค้าคงคลัง: {len(stock)} รายการ")
+    def _show_stock_alert(self, alert):
+        """แสดงการแจ้งเตือนระดับสินค้าคงคลังบนหน้าจอ"""
+        message = alert.message()
+        print(message)
+        self.stock_alert_label.configure(
+            text=message, text_color="green" if alert.kind == 'above' else "red")
+        self.root.after_idle(lambda: messagebox.showwarning("แจ้งเตือนสินค้าคงคลัง", message))
 
     def _calculate(self, mode):
         """คำนวณยอดรวม"""
@@ -600,7 +2537,6 @@ class ScrapShopApp:
                 )
                 result_label = self.result_in_label
                 save_print_button = self.save_print_in_button
-                tree = self.incoming_calc_tree
             else:  # mode == 'out'
                 name1, name2, item, price_var, weight_var = (
                     self.payer_var, self.recipient_var, self.item_out_var,
@@ -608,7 +2544,6 @@ class ScrapShopApp:
                 )
                 result_label = self.result_out_label
                 save_print_button = self.save_print_out_button
-                tree = self.outgoing_calc_tree
 
             # ดึงค่าจากฟอร์ม
             name1_val = name1.get().strip()
@@ -638,17 +2573,17 @@ class ScrapShopApp:
                     "ข้อมูลไม่ครบถ้วน", f"กรุณากรอกข้อมูลให้ครบถ้วน:\n- {', '.join(missing)}")
                 return
 
-            # คำนวณยอดรวม
-            total = price_per_kg * weight
-            current_data = (
-                datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                name1_val, name2_val, item_val, price_per_kg, weight, total
-            )
+            # คำนวณยอดรวม (ใช้ชื่อเดิมของคู่ค้าที่เคยบันทึก ถ้าพิมพ์ต่างกันเล็กน้อย)
+            current_data, rowid = prepare_transaction(
+                self.stores[mode], self.parties, mode,
+                name1_val, name2_val, item_val, price_per_kg, weight)
+            total = current_data[6]
 
             # แสดงผลลัพธ์
             result_label.configure(text=f"รวมทั้งสิ้น: {total:,.2f} บาท")
             save_print_button.configure(state="normal")
-            tree.insert("", "end", values=current_data)
+            self.table_views[f'calc_{mode}'].append(rowid)
+            self.current_rows[mode] = rowid
 
             # เก็บข้อมูลปัจจุบัน
             if mode == 'in':
@@ -673,11 +2608,9 @@ class ScrapShopApp:
             if mode == 'in':
                 data = self.current_in_data
                 excel_file = self.incoming_excel
-                tree = self.receipt_in_tree
             else:  # mode == 'out'
                 data = self.current_out_data
                 excel_file = self.outgoing_excel
-                tree = self.receipt_out_tree
 
             if not data:
                 messagebox.showerror("ไม่มีข้อมูล", "กรุณาคำนวณก่อนบันทึก")
@@ -685,21 +2618,21 @@ class ScrapShopApp:
 
             print(f"💾 กำลังบันทึกข้อมูล {mode}...")
 
-            # บันทึกลง Excel
-            self.save_excel(data, excel_file)
-
-            # สร้างใบเสร็จ PDF
-            filename = self.print_receipt(data, mode)
-
+            rowid, filename, saved = commit_transaction(
+                mode, data, self.current_rows[mode], self.stores[mode], self.parties,
+                self.rollups, self.inventory,
+                save_ledger=lambda data: self.save_excel(data, excel_file),
+                print_receipt=lambda data: self.print_receipt(data, mode),
+                save_history=lambda data, filename: self.save_receipt_history(mode, data, filename))
+            self.current_rows[mode] = rowid
+            if saved:
+                self._render_inventory()
+                self._snapshot_dirty = True
             if filename:
-                # บันทึกประวัติใบเสร็จ
-                self.save_receipt_history(mode, data, filename)
-                tree.insert("", "end", values=(*data, filename))
+                self.table_views[f'receipt_{mode}'].append(rowid)
+                self._snapshot_dirty = True
                 print(f"✅ บันทึกและสร้างใบเสร็จสำเร็จ: {filename}")
 
-            # อัปเดตสินค้าคงคลัง
-            self.compute_inventory()
-
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการบันทึก: {e}")
             messagebox.showerror("เกิดข้อผิดพลาด", f"ไม่สามารถบันทึกได้: {e}")
@@ -707,19 +2640,11 @@ class ScrapShopApp:
     def save_excel(self, data, excel_file):
         """บันทึกข้อมูลลงไฟล์ Excel"""
         try:
-            if os.path.exists(excel_file):
-                wb = load_workbook(excel_file)
-                ws = wb.active
-            else:
-                self.create_excel_file(excel_file)
-                wb = load_workbook(excel_file)
-                ws = wb.active
-
-            ws.append(data)
-            wb.save(excel_file)
+            append_ledger_rows(excel_file, [data])
             print(f"✅ บันทึกข้อมูลลง Excel สำเร็จ: {excel_file}")
             messagebox.showinfo(
                 "สำเร็จ", f"บันทึกข้อมูลลง {os.path.basename(excel_file)} เรียบร้อยแล้ว")
+            return True
 
         except PermissionError:
             print(f"❌ สิทธิ์การเข้าถึงถูกปฏิเสธ: {excel_file}")
@@ -729,80 +2654,18 @@ class ScrapShopApp:
             print(f"❌ ไม่สามารถบันทึก Excel ได้: {e}")
             messagebox.showerror(
                 "เกิดข้อผิดพลาด", f"ไม่สามารถบันทึก Excel ได้: {e}")
+        return False
 
     def print_receipt(self, data, mode):
         """สร้างใบเสร็จ PDF พร้อมฟอนต์ภาษาไทย"""
         try:
-            date, name1, name2, item, price_per_kg, weight, total = data
             dt_str = datetime.now().strftime('%Y%m%d_%H%M%S')
             folder = 'receipts_in' if mode == 'in' else 'receipts_out'
             filename = os.path.join(folder, f"receipt_{dt_str}.pdf")
 
             print(f"🖨️ กำลังสร้างใบเสร็จ: {filename}")
 
-            # สร้าง PDF
-            c = canvas.Canvas(filename, pagesize=letter)
-            width, height = letter
-
-            try:
-                c.setFont(self.thai_font_name, 20)
-            except:
-                c.setFont('Helvetica', 20)
-                print("⚠️ ไม่สามารถใช้ฟอนต์ไทยได้ ใช้ Helvetica แทน")
-
-            title = "ใบเสร็จรับซื้อของเก่า" if mode == 'in' else "ใบเสร็จจำหน่ายของเก่า"
-            title_width = c.stringWidth(title, self.thai_font_name, 20)
-            c.drawString((width - title_width) / 2, height - 100, title)
-
-            y_position = height - 150
-            line_height = 25
-
-            try:
-                c.setFont(self.thai_font_name, 16)
-            except:
-                c.setFont('Helvetica', 16)
-
-            label1 = "ผู้ขาย:" if mode == 'in' else "ผู้จ่าย:"
-            lines = [
-                f"{label1} {name1}",
-                f"ผู้รับ: {name2}",
-                f"สินค้า: {item}",
-                f"ราคาต่อหน่วย: {price_per_kg:,.2f} บาท/กก.",
-                f"น้ำหนัก: {weight:,.2f} กก.",
-            ]
-
-            for line in lines:
-                c.drawString(100, y_position, line)
-                y_position -= line_height
-
-            c.line(100, y_position - 10, width - 100, y_position - 10)
-            y_position -= 30
-
-            try:
-                c.setFont(self.thai_font_name, 18)
-            except:
-                c.setFont('Helvetica-Bold', 18)
-
-            total_text = f"รวมทั้งสิ้น: {total:,.2f} บาท"
-            c.drawString(100, y_position, total_text)
-
-            c.line(100, y_position - 20, width - 100, y_position - 20)
-            y_position -= 40
-
-            try:
-                c.setFont(self.thai_font_name, 14)
-            except:
-                c.setFont('Helvetica', 14)
-
-            c.drawString(100, y_position, f"วันที่: {date}")
-
-            y_position -= 80
-            c.drawString(100, y_position,
-                         "ลายเซ็นผู้รับ: _____________________")
-            c.drawString(350, y_position,
-                         "ลายเซ็นผู้จ่าย: _____________________")
-
-            c.save()
+            render_receipt_pdf(filename, data, mode, self.thai_font_name)
 
             self.open_file(filename)
             messagebox.showinfo(
@@ -906,11 +2769,959 @@ def debug_prices_file():
 
     print("🔍 === จบการดีบัก ===\n")
 
+# --- ตรวจสอบความสอดคล้องของข้อมูล (Excel / receipt_history.json / PDF) ---
+RECONCILE_CACHE_FILE = os.path.join('data', 'reconcile_cache.bin')
+RECEIPT_FOLDERS = {'in': 'receipts_in', 'out': 'receipts_out'}
+_RECEIPT_META_RE = re.compile(
+    rb'/Keywords \(' + re.escape(RECEIPT_META_PREFIX.encode('ascii')) + rb'([A-Za-z0-9+/=]+)\)')
+_RECEIPT_NAME_RE = re.compile(r'receipt_(\d{8}_\d{6})')
+
+
+def scan_receipt_pdf(path):
+    """อ่าน PDF หนึ่งไฟล์: คืนค่า sha256 และรายการที่ฝังไว้ (ถ้ามี)"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    record = None
+    match = _RECEIPT_META_RE.search(content)
+    if match:
+        try:
+            record = json.loads(base64.b64decode(match.group(1)).decode('utf-8'))
+        except ValueError:
+            record = None
+    return hashlib.sha256(content).hexdigest(), record
+
+
+def _scan_receipt_batch(paths):
+    return [scan_receipt_pdf(path) for path in paths]
+
+
+def _record_identity(record):
+    date = record[0].strftime(DATE_FORMAT) if isinstance(record[0], datetime) else str(record[0])
+    return (date, str(record[1] or ''), str(record[2] or ''), str(record[3] or ''))
+
+
+def _record_content(record):
+    # ปัดเศษแบบเดียวกับ RecordStore.record_key (Excel เก็บทศนิยมได้ 15 หลัก)
+    return _record_identity(record) + tuple(round(float(value or 0), 6) for value in record[4:7])
+
+
+def records_match(a, b, tolerance=0.005):
+    """รายการเดียวกันและราคา/น้ำหนัก/ยอดรวมต่างกันน้อยกว่า tolerance (ไม่นับเศษทศนิยมจากการปัด)"""
+    return _record_identity(a) == _record_identity(b) and all(
+        abs(float(x or 0) - float(y or 0)) < tolerance for x, y in zip(a[4:7], b[4:7]))
+
+
+def record_hash(record):
+    """hash ของเนื้อหารายการ (วันที่, ชื่อ, สินค้า, ราคา, น้ำหนัก, รวม)"""
+    return hashlib.sha1(repr(_record_content(record)).encode('utf-8')).hexdigest()
+
+
+def scan_data_sources(root='.', workers=None):
+    """อ่านสมุดบัญชีทั้งสองโหมดและใบเสร็จ PDF ทั้งหมดแบบขนานด้วย process pool
+
+    ผลการอ่าน PDF ถูกเก็บไว้ใน cache ตามขนาด/เวลาแก้ไข จึงอ่านใหม่เฉพาะไฟล์ที่เปลี่ยน
+    """
+    cache_file = os.path.join(root, RECONCILE_CACHE_FILE)
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        cache = {}
+
+    pdfs, to_scan = {}, []
+    for mode, folder in RECEIPT_FOLDERS.items():
+        folder_path = os.path.join(root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for entry in os.scandir(folder_path):
+            if not entry.name.lower().endswith('.pdf'):
+                continue
+            key = f"{folder}/{entry.name}"
+            st = entry.stat()
+            cached = cache.get(key)
+            if cached and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime_ns:
+                pdfs[key] = cached
+            else:
+                pdfs[key] = {'mode': mode, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+                to_scan.append(key)
+
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, min(256, len(to_scan) // (workers * 4) or 1))
+    batches = [to_scan[i:i + batch_size] for i in range(0, len(to_scan), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        ledger_futures = {
+            mode: pool.submit(read_ledger_rows, os.path.join(root, 'data', name))
+            for mode, name in (('in', 'incoming_scrap_records.xlsx'),
+                               ('out', 'outgoing_scrap_records.xlsx'))
+        }
+        scan_futures = [pool.submit(_scan_receipt_batch, [os.path.join(root, key) for key in batch])
+                        for batch in batches]
+
+        history_file = os.path.join(root, 'data', 'receipt_history.json')
+        history = {'in': [], 'out': []}
+        if os.path.exists(history_file):
+            with open(history_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+
+        for batch, future in zip(batches, scan_futures):
+            for key, (digest, record) in zip(batch, future.result()):
+                pdfs[key].update(sha256=digest, record=record)
+        ledgers = {mode: future.result() for mode, future in ledger_futures.items()}
+
+    try:
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(pdfs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"⚠️ ไม่สามารถบันทึก cache การตรวจสอบได้: {e}")
+
+    print(f"🔎 อ่าน PDF ใหม่ {len(to_scan)} จาก {len(pdfs)} ไฟล์")
+    return ledgers, history, pdfs
+
+
+def _receipt_name_time(key):
+    match = _RECEIPT_NAME_RE.search(key)
+    if not match:
+        return None
+    return parse_timestamp(datetime.strptime(match.group(1), '%Y%m%d_%H%M%S'))
+
+
+def reconcile(root='.', repair=False, workers=None):
+    """เทียบ Excel, receipt_history.json และโฟลเดอร์ PDF แล้วคืนค่ารายงานความไม่สอดคล้อง
+
+    repair=True จะซ่อมตามแหล่งที่น่าเชื่อถือที่สุด: Excel เป็นหลักสำหรับตัวเลข,
+    ใบเสร็จ PDF ที่ออกให้ลูกค้าแล้วยืนยันรายการที่ไม่มีใน Excel การซ่อมเขียน
+    receipt_history.json ใหม่ทั้งไฟล์ จึงถือ DataLock ตั้งแต่อ่านข้อมูลและไม่ทำงานขณะที่หน้าร้านเปิดอยู่
+    """
+    if repair:
+        with DataLock(root, 'การซ่อมข้อมูล (--reconcile --repair)'):
+            return _reconcile(root, True, workers)
+    return _reconcile(root, False, workers)
+
+
+def _reconcile(root, repair, workers):
+    ledgers, history, pdfs = scan_data_sources(root, workers)
+    report = {'missing_history': [], 'orphan_history': [], 'missing_pdf': [],
+              'orphan_pdf': [], 'mismatched': []}
+    # ใบเสร็จของรายการที่เก็บถาวรแล้วไม่นับเป็น PDF ที่ไม่มีประวัติ
+    referenced = ArchiveStore(os.path.join(root, ARCHIVE_DIR)).referenced_files()
+    pdf_by_identity = {}
+    for key, info in pdfs.items():
+        record = info.get('record')
+        if record:
+            pdf_by_identity.setdefault((record[0], *_record_identity(record[1:])), []).append(key)
+
+    for mode in ('in', 'out'):
+        unmatched = {}
+        for index, row in enumerate(ledgers[mode]):
+            unmatched.setdefault(_record_identity(row), []).append(index)
+            if abs(float(row[4] or 0) * float(row[5] or 0) - float(row[6] or 0)) > 0.01:
+                report['mismatched'].append({'mode': mode, 'source': 'excel', 'record': row,
+                                             'detail': 'ยอดรวมไม่เท่ากับราคา × น้ำหนัก'})
+
+        for index, record in enumerate(history.get(mode, [])):
+            candidates = unmatched.get(_record_identity(record))
+            ledger_index = candidates.pop(0) if candidates else None
+            entry = {'mode': mode, 'record': record, 'history_index': index,
+                     'ledger_index': ledger_index}
+            if ledger_index is None:
+                report['orphan_history'].append(entry)
+            else:
+                ledger_row = ledgers[mode][ledger_index]
+                if not records_match(record, ledger_row):
+                    report['mismatched'].append(dict(
+                        entry, source='history',
+                        detail=f"Excel: {tuple(ledger_row[4:7])} / JSON: {tuple(record[4:7])}"))
+
+            key = normalize_receipt_path(record[7]) if len(record) > 7 and record[7] else None
+            if key is None or key not in pdfs:
+                report['missing_pdf'].append(dict(entry, file=key))
+                continue
+            referenced.add(key)
+            pdf_record = pdfs[key].get('record')
+            if pdf_record and not records_match(pdf_record[1:], record):
+                report['mismatched'].append(dict(entry, source='pdf', file=key,
+                                                 detail=f"PDF: {tuple(pdf_record[5:8])} / JSON: {tuple(record[4:7])}"))
+
+        for indices in unmatched.values():
+            for index in indices:
+                report['missing_history'].append(
+                    {'mode': mode, 'record': ledgers[mode][index], 'ledger_index': index})
+
+    orphan_pdfs = {key for key in pdfs if key not in referenced}
+
+    # จับคู่ PDF ที่ไม่มีประวัติกับแถว Excel ที่ไม่มีประวัติ: ใช้ข้อมูลที่ฝังใน PDF ก่อน
+    # แล้วจึงใช้เวลาในชื่อไฟล์ (พิมพ์ไม่เกิน 10 นาทีหลังคำนวณ และต้องมีผู้สมัครเพียงไฟล์เดียว)
+    for entry in report['missing_history']:
+        identity = (entry['mode'], *_record_identity(entry['record']))
+        keys = [key for key in pdf_by_identity.get(identity, []) if key in orphan_pdfs]
+        if not keys:
+            row_ts = parse_timestamp(entry['record'][0])
+            keys = [key for key in orphan_pdfs
+                    if pdfs[key]['mode'] == entry['mode'] and not pdfs[key].get('record')
+                    and row_ts is not None and (file_ts := _receipt_name_time(key)) is not None
+                    and 0 <= file_ts - row_ts <= 600]
+        if len(keys) == 1:
+            entry['file'] = keys[0]
+            orphan_pdfs.discard(keys[0])
+
+    # PDF ที่ยังไม่มีรายการใดอ้างถึงหลังการจับคู่ (ข้อมูลที่ฝังใน PDF ขึ้นต้นด้วยโหมด)
+    for key in sorted(orphan_pdfs):
+        pdf_record = pdfs[key].get('record')
+        report['orphan_pdf'].append({'mode': pdfs[key]['mode'], 'file': key,
+                                     'record': pdf_record[1:] if pdf_record else None})
+
+    if repair:
+        repair_data_sources(root, report, ledgers, history)
+    return report
+
+
+def register_pdf_font():
+    """ลงทะเบียนฟอนต์ไทยสำหรับสร้าง PDF นอกหน้าจอโปรแกรม"""
+    for font_path in THAI_FONT_PATHS:
+        if os.path.exists(font_path):
+            try:
+                pdfmetrics.registerFont(TTFont('THSarabun', font_path))
+                return 'THSarabun'
+            except Exception as e:
+                print(f"❌ ไม่สามารถลงทะเบียนฟอนต์ {font_path}: {e}")
+    return 'Helvetica'
+
+
+def _unique_receipt_path(root, mode, record):
+    ts = parse_timestamp(record[0])
+    stamp = (_EPOCH + timedelta(seconds=ts)).strftime('%Y%m%d_%H%M%S') if ts is not None \
+        else datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = os.path.join(RECEIPT_FOLDERS[mode], f"receipt_{stamp}.pdf")
+    counter = 1
+    while os.path.exists(os.path.join(root, filename)):
+        filename = os.path.join(RECEIPT_FOLDERS[mode], f"receipt_{stamp}_{counter}.pdf")
+        counter += 1
+    return filename
+
+
+def repair_data_sources(root, report, ledgers, history):
+    """ซ่อมข้อมูลตามรายงานของ reconcile"""
+    font_name = register_pdf_font()
+    new_ledger_rows = {'in': [], 'out': []}
+    repaired = 0
+
+    # ตัวเลขใน JSON ที่ไม่ตรงกับ Excel: ใช้ค่าจาก Excel
+    for entry in report['mismatched']:
+        if entry['source'] == 'history':
+            ledger_row = ledgers[entry['mode']][entry['ledger_index']]
+            record = history[entry['mode']][entry['history_index']]
+            record[:7] = list(ledger_row[:7])
+            repaired += 1
+
+    # แถว Excel ที่ไม่มีประวัติใบเสร็จ: ใช้ PDF ที่จับคู่ได้ หรือสร้างใบเสร็จใหม่
+    for entry in report['missing_history']:
+        mode, row = entry['mode'], list(entry['record'][:7])
+        filename = entry.get('file')
+        if filename is None:
+            filename = _unique_receipt_path(root, mode, row)
+            render_receipt_pdf(os.path.join(root, filename), row, mode, font_name)
+        history.setdefault(mode, []).append(row + [filename])
+        repaired += 1
+
+    # ประวัติที่ไม่มีใน Excel แต่มีใบเสร็จ PDF ยืนยัน: เพิ่มกลับเข้า Excel
+    without_pdf = {(entry['mode'], entry['history_index']) for entry in report['missing_pdf']}
+    for entry in report['orphan_history']:
+        if (entry['mode'], entry['history_index']) not in without_pdf:
+            new_ledger_rows[entry['mode']].append(tuple(entry['record'][:7]))
+            repaired += 1
+
+    # ใบเสร็จ PDF ที่หายไป: สร้างใหม่จากข้อมูลใน Excel (หรือ JSON ถ้าไม่มีใน Excel)
+    for entry in report['missing_pdf']:
+        mode = entry['mode']
+        record = history[mode][entry['history_index']]
+        if entry['ledger_index'] is None:
+            continue  # ไม่มีแหล่งยืนยันรายการ รายงานอย่างเดียว
+        filename = entry['file'] or _unique_receipt_path(root, mode, record)
+        target = os.path.join(root, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        render_receipt_pdf(target, ledgers[mode][entry['ledger_index']][:7], mode, font_name)
+        if len(record) > 7:
+            record[7] = record[7] or filename
+        else:
+            record.append(filename)
+        repaired += 1
+
+    for mode, name in (('in', 'incoming_scrap_records.xlsx'),
+                       ('out', 'outgoing_scrap_records.xlsx')):
+        if new_ledger_rows[mode]:
+            append_ledger_rows(os.path.join(root, 'data', name), new_ledger_rows[mode])
+    write_receipt_history(os.path.join(root, 'data', 'receipt_history.json'), history)
+    print(f"🛠️ ซ่อมข้อมูลแล้ว {repaired} รายการ")
+    return repaired
+
+
+def print_reconcile_report(report, limit=20):
+    """แสดงรายงานการตรวจสอบความสอดคล้องของข้อมูล"""
+    titles = {
+        'missing_history': "มีใน Excel แต่ไม่มีประวัติใบเสร็จ",
+        'orphan_history': "มีประวัติใบเสร็จแต่ไม่มีใน Excel",
+        'missing_pdf': "ไม่พบไฟล์ PDF ของประวัติใบเสร็จ",
+        'orphan_pdf': "ไฟล์ PDF ที่ไม่มีประวัติอ้างถึง",
+        'mismatched': "ข้อมูลไม่ตรงกัน",
+    }
+    print("🔍 === รายงานความสอดคล้องของข้อมูล ===")
+    for key, title in titles.items():
+        entries = report[key]
+        print(f"{'✅' if not entries else '⚠️'} {title}: {len(entries)} รายการ")
+        for entry in entries[:limit]:
+            details = [entry['mode']]
+            if entry.get('record'):
+                details.append(str(tuple(entry['record'])[:7]))
+            if entry.get('file'):
+                details.append(entry['file'])
+            if entry.get('detail'):
+                details.append(entry['detail'])
+            print(f"   - {' | '.join(details)}")
+        if len(entries) > limit:
+            print(f"   ... และอีก {len(entries) - limit} รายการ")
+    print("🔍 === จบรายงาน ===")
+
+
+# --- ทดสอบโหลดแบบไม่มีหน้าจอ ---
+LOAD_TEST_STAGES = ('calculate', 'persist', 'parties', 'rollups', 'inventory', 'render', 'history')
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    """สุ่มรายการซื้อขายที่ใกล้เคียงหน้าร้านจริงจากราคาใน prices.json"""
+
+    def __init__(self, buy_prices, sell_prices, seed=None, customers=300):
+        import random
+        self.random = random.Random(seed)
+        self.buy_prices = buy_prices
+        self.sell_prices = sell_prices
+        self.items = list(buy_prices)
+        # ของราคาถูกมาบ่อยและหนักกว่า ของราคาแพง (เช่น ทองแดง) มาไม่บ่อยและน้ำหนักน้อย
+        self.item_weights = [1 / max(price, 0.1) ** 0.5 for price in buy_prices.values()]
+        self.customers = [f"ลูกค้า{i:04d}" for i in range(customers)]
+        # ลูกค้าประจำไม่กี่รายมาบ่อย (แจกแจงแบบ Zipf)
+        self.customer_weights = [1 / (rank + 1) for rank in range(customers)]
+        self.factories = ["โรงงานรีไซเคิลเอ", "บริษัทเหล็กไทย", "โรงงานกระดาษบี"]
+
+    def next(self, when):
+        """คืนค่า (โหมด, ข้อมูลรายการ)"""
+        rnd = self.random
+        item = rnd.choices(self.items, self.item_weights)[0]
+        typical_kg = 40 / max(self.buy_prices[item], 0.1) ** 0.5
+        if rnd.random() < 0.1 and item in self.sell_prices:
+            weight = round(rnd.lognormvariate(0, 0.5) * typical_kg * 20, 1)
+            return 'out', build_transaction(
+                "นายคิว", rnd.choice(self.factories), item,
+                self.sell_prices[item], weight, when)
+        weight = round(max(0.1, rnd.lognormvariate(0, 0.8) * typical_kg), 1)
+        name = rnd.choices(self.customers, self.customer_weights)[0]
+        return 'in', build_transaction(
+            name, "นายคิว", item, self.buy_prices[item], weight, when)
+
+
+def run_load_test(tps=2.0, count=1000, days=365, report_every=None, workdir=None,
+                  prices_file='prices.json', render_pdf=True, seed=1):
+    """ยิงรายการผ่าน prepare_transaction/commit_transaction (ขั้นตอนเดียวกับหน้าร้าน)
+    ที่อัตราที่กำหนด แล้ววัด latency ทีละขั้น
+
+    ใช้ข้อมูลในโฟลเดอร์ชั่วคราว (ลบทิ้งเมื่อจบ) หรือ workdir (เก็บไว้) เพื่อไม่ให้กระทบข้อมูลจริง
+    วันที่ของรายการเดินหน้าตาม days เพื่อจำลองข้อมูลที่สะสมตลอดทั้งปี และปิดยอดวันก่อนหน้า
+    เมื่อขึ้นวันใหม่เหมือนการเปิดโปรแกรมทุกเช้า
+    """
+    import shutil
+    import tempfile
+    with open(prices_file, 'r', encoding='utf-8') as f:
+        prices = json.load(f)
+    temporary = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='scrapshop_load_')
+    try:
+        return _run_load_test(tps, count, days, report_every, workdir, prices, render_pdf, seed)
+    finally:
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_load_test(tps, count, days, report_every, workdir, prices, render_pdf, seed):
+    for folder in ['data', *RECEIPT_FOLDERS.values()]:
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    ledger_files = {mode: os.path.join(workdir, path) for mode, path in LEDGER_FILES.items()}
+    history_file = os.path.join(workdir, HISTORY_FILE)
+    font_name = register_pdf_font() if render_pdf else None
+
+    generator = LoadGenerator(prices['BUY_PRICES'], prices['SELL_PRICES'], seed)
+    stores = {'in': RecordStore(), 'out': RecordStore()}
+    parties = {(mode, column): PartyDirectory()
+               for mode in ('in', 'out') for column in ('name1', 'name2')}
+    rollups = DailyRollups(os.path.join(workdir, ROLLUPS_FILE), ledger_files)
+    inventory = Inventory()
+    report_every = report_every or max(1, count // 12)
+    simulated_start = datetime(datetime.now().year, 1, 1, 8, 0)
+    step = timedelta(days=days) / max(count, 1)
+
+    print(f"🚦 ทดสอบโหลด {count} รายการ ที่ {tps:g} รายการ/วินาที → {workdir}")
+    header = f"{'รายการ':>8} {'วันที่จำลอง':>12} {'ช้ากว่าแผน':>10} " + " ".join(
+        f"{stage + ' p50/p95/p99 (ms)':>30}" for stage in LOAD_TEST_STAGES)
+    print(header)
+
+    samples = {stage: [] for stage in LOAD_TEST_STAGES}
+    totals, bucket_totals = [], []
+    current_day = None
+    started = time.perf_counter()
+    for index in range(count):
+        # เว้นจังหวะตามอัตราที่กำหนด ถ้าช้ากว่าแผนให้ทำรายการถัดไปทันที
+        scheduled = started + index / tps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        lag = max(0.0, time.perf_counter() - scheduled)
+
+        when = simulated_start + step * index
+        day = when.strftime('%Y-%m-%d')
+        if current_day is not None and day != current_day:
+            rollups.close(current_day)
+        current_day = day
+
+        mode, data = generator.next(when)
+        t0 = time.perf_counter()
+        data, rowid = prepare_transaction(stores[mode], parties, mode, *data[1:6], when=when)
+        timings = {'calculate': time.perf_counter() - t0}
+        filename = os.path.join(RECEIPT_FOLDERS[mode],
+                                f"receipt_{when.strftime('%Y%m%d_%H%M%S')}_{index}.pdf")
+
+        def print_receipt(data, mode=mode, filename=filename):
+            if render_pdf:
+                render_receipt_pdf(os.path.join(workdir, filename), data, mode, font_name)
+            return filename
+
+        def save_ledger(data, mode=mode):
+            append_ledger_rows(ledger_files[mode], [data])
+            return True
+
+        commit_transaction(
+            mode, data, rowid, stores[mode], parties, rollups, inventory,
+            save_ledger=save_ledger, print_receipt=print_receipt,
+            save_history=lambda data, filename, mode=mode: append_receipt_history(
+                history_file, mode, list(data) + [filename]),
+            timings=timings)
+        for stage in LOAD_TEST_STAGES:
+            samples[stage].append(timings[stage] * 1000)
+        totals.append(sum(timings.values()) * 1000)
+
+        if (index + 1) % report_every == 0 or index + 1 == count:
+            bucket_totals = totals[-((index % report_every) + 1):]
+            columns = []
+            for stage in LOAD_TEST_STAGES:
+                values = sorted(samples[stage])
+                columns.append(f"{_percentile(values, 0.5):9.1f}/{_percentile(values, 0.95):8.1f}/"
+                               f"{_percentile(values, 0.99):8.1f}".rjust(30))
+                samples[stage] = []
+            print(f"{index + 1:>8} {when.strftime('%d/%m/%Y'):>12} {lag:>9.2f}s " + " ".join(columns))
+
+    elapsed = time.perf_counter() - started
+    totals.sort()
+    # ใช้ช่วงสุดท้าย (ข้อมูลสะสมมากที่สุด) ประมาณความสามารถของหน้าร้าน
+    mean_ms = sum(bucket_totals) / len(bucket_totals) if bucket_totals else 0.0
+    print(f"✅ ทำได้จริง {count / elapsed:.2f} รายการ/วินาที "
+          f"(p95 ต่อรายการ {_percentile(totals, 0.95):.1f} ms)")
+    if mean_ms:
+        print(f"👥 ประมาณการลูกค้าสูงสุด ~{int(3600 * 1000 / mean_ms):,} รายต่อชั่วโมง "
+              f"ที่ขนาดข้อมูลปัจจุบัน (ยังไม่รวมเวลากรอกข้อมูลของพนักงาน)")
+    return {'elapsed': elapsed, 'totals_ms': totals}
+
+
+# --- ย้ายข้อมูลงวดที่ปิดแล้วไปเก็บถาวร ---
+LEDGER_FILES = {'in': os.path.join('data', 'incoming_scrap_records.xlsx'),
+                'out': os.path.join('data', 'outgoing_scrap_records.xlsx')}
+HISTORY_FILE = os.path.join('data', 'receipt_history.json')
+
+
+def _month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def _archivable_ts(record, cutoff_ts):
+    """timestamp ของรายการที่ย้ายได้ (วันที่อ่านได้ อยู่ก่อนงวดที่เปิด และตัวเลขถูกต้อง) หรือ None"""
+    ts = parse_timestamp(record[0])
+    if ts is None or ts >= cutoff_ts:
+        return None
+    try:
+        float(record[4] or 0), float(record[5] or 0), float(record[6] or 0)
+    except (TypeError, ValueError):
+        return None
+    return ts
+
+
+def _segment_columns(store, rowids):
+    return {
+        'ts': array('d', (store.ts[i] for i in rowids)),
+        'name1': [store.name1[i] for i in rowids],
+        'name2': [store.name2[i] for i in rowids],
+        'item': [store.item[i] for i in rowids],
+        'price': array('d', (store.price[i] for i in rowids)),
+        'weight': array('d', (store.weight[i] for i in rowids)),
+        'total': array('d', (store.total[i] for i in rowids)),
+        'flags': array('B', (store.flags[i] for i in rowids)),
+        'file': [store.files.get(i, '') for i in rowids],
+    }
+
+
+def archive_closed_periods(root='.', keep_months=12, now=None):
+    """ย้ายรายการของเดือนที่เก่ากว่า keep_months เดือนจาก Excel และ receipt_history.json ไปเป็น segment
+
+    เขียน segment และ manifest ก่อน แล้วจึงเขียนไฟล์ที่ใช้งานใหม่ ถ้าหยุดกลางทาง
+    การรันซ้ำจะไม่เพิ่มรายการซ้ำใน segment เดิม ไม่ทำงานขณะที่หน้าร้านเปิดอยู่ (DataLock)
+    เพื่อไม่ให้รายการที่บันทึกระหว่างนั้นหายไปตอนเขียน Excel ใหม่
+    """
+    with DataLock(root, 'การย้ายข้อมูลเก็บถาวร (--archive)'):
+        return _archive_closed_periods(root, keep_months, now)
+
+
+def _archive_closed_periods(root, keep_months, now):
+    now = now or datetime.now()
+    cutoff = _month_start(now.year, now.month - keep_months)
+    cutoff_ts = parse_timestamp(cutoff)
+    archive = ArchiveStore(os.path.join(root, ARCHIVE_DIR))
+    os.makedirs(archive.directory, exist_ok=True)
+
+    history_file = os.path.join(root, HISTORY_FILE)
+    history = {'in': [], 'out': []}
+    if os.path.exists(history_file):
+        with open(history_file, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+
+    live_ledgers, archived = {}, 0
+    for mode in ('in', 'out'):
+        ledger_rows = read_ledger_rows(os.path.join(root, LEDGER_FILES[mode]))
+        old_rows = [row for row in ledger_rows if _archivable_ts(row, cutoff_ts) is not None]
+        live_ledgers[mode] = [row for row in ledger_rows if _archivable_ts(row, cutoff_ts) is None]
+        old_records = [r for r in history.get(mode, []) if _archivable_ts(r, cutoff_ts) is not None]
+        history[mode] = [r for r in history.get(mode, []) if _archivable_ts(r, cutoff_ts) is None]
+
+        store = RecordStore()
+        store.load(old_rows, old_records)
+        by_period = {}
+        for rowid in range(len(store)):
+            period = format_timestamp(store.ts[rowid])[3:10]  # mm/YYYY
+            by_period.setdefault(period, []).append(rowid)
+
+        for period, rowids in sorted(by_period.items()):
+            month, year = period.split('/')
+            period_key = f"{year}-{month}"
+            meta = archive.segment(mode, period_key)
+            columns = _segment_columns(store, rowids)
+            if meta is not None:
+                # รวมกับ segment เดิม (เช่น รายการที่บันทึกย้อนหลัง) โดยไม่เพิ่มรายการที่มีอยู่แล้ว
+                existing = read_segment(os.path.join(archive.directory, meta['file']))
+                seen = {record_hash((format_timestamp(existing['ts'][i]), existing['name1'][i],
+                                     existing['name2'][i], existing['item'][i], existing['price'][i],
+                                     existing['weight'][i], existing['total'][i]))
+                        for i in range(len(existing['ts']))}
+                keep = [i for i, rowid in enumerate(rowids) if record_hash(store.row(rowid)) not in seen]
+                for name in SEGMENT_COLUMNS:
+                    existing[name].extend(columns[name][i] for i in keep)
+                columns = existing
+                archived += len(keep)
+            else:
+                archived += len(rowids)
+                meta = {'mode': mode, 'period': period_key,
+                        'file': f"{mode}_{period_key}.seg"}
+                archive.segments.append(meta)
+
+            items, other_items = {}, set()
+            for i, item in enumerate(columns['item']):
+                if not columns['flags'][i] & RecordStore.LEDGER:
+                    other_items.add(item)
+                    continue
+                values = items.setdefault(item, [0.0, 0.0, 0])
+                values[0] += columns['weight'][i]
+                values[1] += columns['total'][i]
+                values[2] += 1
+            write_segment(os.path.join(archive.directory, meta['file']), columns)
+            meta.update(min_ts=min(columns['ts']), max_ts=max(columns['ts']),
+                        count=len(columns['ts']), items=items,
+                        other_items=sorted(other_items - set(items)))
+
+    archive.segments.sort(key=lambda meta: (meta['mode'], meta['period']))
+    archive.save()
+
+    # เขียนไฟล์ที่ใช้งานอยู่ใหม่ให้เหลือเฉพาะงวดที่ยังเปิด
+    write_receipt_history(history_file, history)
+    for mode in ('in', 'out'):
+        excel_file = os.path.join(root, LEDGER_FILES[mode])
+        tmp_file = f"{excel_file}.tmp"
+        create_ledger_file(tmp_file, live_ledgers[mode])
+        os.replace(tmp_file, excel_file)
+
+    print(f"🗄️ ย้ายรายการก่อน {cutoff.strftime('%d/%m/%Y')} ไปเก็บถาวร {archived} รายการ "
+          f"({len(archive.segments)} segment)")
+    return archived
+
+
+def period_report(root, start, end):
+    """ยอดรายสินค้าของแต่ละโหมดในช่วง [start, end)
+
+    วันที่ปิดยอดแล้วอ่านจากยอดปิดประจำวัน วันที่ยังเปิดอ่านจากยอดที่หน้าร้านเขียนไว้
+    อ่านข้อมูลถาวรและ Excel เฉพาะเมื่อยังไม่เคยปิดยอดหรือ Excel ถูกแก้หลังจากหน้าร้านเขียนยอดไว้
+    """
+    rollups = DailyRollups(os.path.join(root, ROLLUPS_FILE),
+                           {mode: os.path.join(root, path) for mode, path in LEDGER_FILES.items()})
+    start_day, end_day = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    if rollups.closed_through is not None:
+        if end_day <= rollups.closed_through or rollups.load_open():
+            _warn_undated(_figures_count(rollups.undated))
+            return rollups.totals(start_day, end_day)
+        print("🔄 ไม่มียอดของวันที่ยังเปิดที่ตรงกับ Excel ปัจจุบัน อ่านรายการจาก Excel แทน")
+    report = rollups.totals(start_day, end_day)
+    if rollups.closed_through is not None:
+        start = max(start, datetime.strptime(rollups.closed_through, '%Y-%m-%d') + timedelta(days=1))
+    start_ts, end_ts = parse_timestamp(start), parse_timestamp(end)
+    archive = ArchiveStore(os.path.join(root, ARCHIVE_DIR))
+    undated = 0
+    for mode in ('in', 'out'):
+        totals = report[mode]
+        for item, values in archive.summary(mode, start_ts, end_ts).items():
+            _add_figures(report, mode, item, *values)
+        for row in read_ledger_rows(os.path.join(root, LEDGER_FILES[mode])):
+            ts = parse_timestamp(row[0])
+            if ts is None and row[3]:
+                undated += 1
+            if ts is None or not start_ts <= ts < end_ts or not row[3]:
+                continue
+            values = totals.setdefault(row[3], [0.0, 0.0, 0])
+            values[0] += float(row[5] or 0)
+            values[1] += float(row[6] or 0)
+            values[2] += 1
+    _warn_undated(undated)
+    return report
+
+
+def _warn_undated(count):
+    if count:
+        print(f"⚠️ มี {count} รายการใน Excel ที่อ่านวันที่ไม่ได้ ไม่รวมในรายงานนี้ (นับรวมในสินค้าคงคลัง)")
+
+
+def period_transactions(root, start, end, item=None):
+    """รายการใน Excel ของแต่ละโหมดในช่วง [start, end) (กรองตามสินค้าได้) เรียงตามเวลา
+
+    ข้อมูลที่เก็บถาวรอ่านเฉพาะ segment ที่ช่วงวันที่และรายชื่อสินค้าใน manifest เกี่ยวข้อง
+    """
+    start_ts, end_ts = parse_timestamp(start), parse_timestamp(end)
+    archive = ArchiveStore(os.path.join(root, ARCHIVE_DIR))
+    transactions = {}
+    for mode in ('in', 'out'):
+        rows = [row[:7] for row in archive.query(mode, start_ts, end_ts, item, ledger_only=True)]
+        for row in read_ledger_rows(os.path.join(root, LEDGER_FILES[mode])):
+            ts = parse_timestamp(row[0])
+            if ts is None or not start_ts <= ts < end_ts or (item is not None and row[3] != item):
+                continue
+            rows.append(row[:7])
+        rows.sort(key=lambda row: parse_timestamp(row[0]))
+        transactions[mode] = rows
+    return transactions
+
+
+def print_period_transactions(transactions):
+    for mode, title in (('in', "รับเข้า"), ('out', "จำหน่ายออก")):
+        rows = transactions[mode]
+        print(f"{title}: {len(rows)} รายการ")
+        for date, name1, name2, item, price, weight, total in rows:
+            date = date.strftime(DATE_FORMAT) if isinstance(date, datetime) else date
+            print(f"   - {date} {name1} → {name2} | {item} {float(weight or 0):,.2f} กก. "
+                  f"x {float(price or 0):,.2f} = {float(total or 0):,.2f} บาท")
+
+
+def print_period_report(report, start, end):
+    print(f"📈 === รายงานช่วง {start.strftime('%d/%m/%Y')} - {end.strftime('%d/%m/%Y')} ===")
+    for mode, title in (('in', "รับเข้า"), ('out', "จำหน่ายออก")):
+        totals = report[mode]
+        print(f"{title}:")
+        for item, (kg, amount, count) in sorted(totals.items()):
+            print(f"   - {item}: {kg:,.2f} กก. {amount:,.2f} บาท ({count} รายการ)")
+        print(f"   รวม {sum(v[0] for v in totals.values()):,.2f} กก. "
+              f"{sum(v[1] for v in totals.values()):,.2f} บาท")
+
+
+
+# --- รวมยอดหลายสาขา ---
+CONSOLIDATION_CACHE_FILE = os.path.join('data', 'consolidation_cache.bin')
+
+
+def _branch_sources(root):
+    """ไฟล์ของสาขาที่ใช้คำนวณยอดรวม (ถ้าไฟล์ใดเปลี่ยนต้องคำนวณสาขานั้นใหม่)"""
+    return [os.path.join(root, LEDGER_FILES['in']), os.path.join(root, LEDGER_FILES['out']),
+            os.path.join(root, ARCHIVE_DIR, 'manifest.json'), os.path.join(root, 'prices.json')]
+
+
+def aggregate_branch(root):
+    """ยอดรายสินค้าของหนึ่งสาขา {สินค้า: {'in': [กก., บาท, รายการ], 'out': [...]}} พร้อม fingerprint ของไฟล์"""
+    fingerprints = {path: file_fingerprint(path) for path in _branch_sources(root)}
+    archive = ArchiveStore(os.path.join(root, ARCHIVE_DIR))
+    items = {}
+    for mode in ('in', 'out'):
+        for item, values in archive.summary(mode).items():
+            items.setdefault(item, {'in': [0.0, 0.0, 0], 'out': [0.0, 0.0, 0]})[mode] = list(values)
+        for row in read_ledger_rows(os.path.join(root, LEDGER_FILES[mode])):
+            if not row[3]:
+                continue
+            values = items.setdefault(row[3], {'in': [0.0, 0.0, 0], 'out': [0.0, 0.0, 0]})[mode]
+            values[0] += float(row[5] or 0)
+            values[1] += float(row[6] or 0)
+            values[2] += 1
+    buy_prices = {}
+    prices_file = os.path.join(root, 'prices.json')
+    if os.path.exists(prices_file):
+        try:
+            with open(prices_file, 'r', encoding='utf-8') as f:
+                buy_prices = json.load(f).get('BUY_PRICES', {})
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ ไม่สามารถอ่าน {prices_file}: {e}")
+    return {'fingerprints': fingerprints, 'items': items, 'buy_prices': buy_prices}
+
+
+def _item_figures(values, buy_price=None):
+    """คงคลัง ต้นทุนเฉลี่ย และกำไรขั้นต้นของหนึ่งสินค้า
+
+    กำไร = ยอดขาย - กก. ที่ขาย x ต้นทุนรับซื้อเฉลี่ย (ถ้าไม่เคยรับซื้อ ใช้ราคารับซื้อปัจจุบันใน prices.json)
+    """
+    in_kg, in_amount, _ = values['in']
+    out_kg, out_amount, _ = values['out']
+    cost = in_amount / in_kg if in_kg else (buy_price or 0.0)
+    remaining = in_kg - out_kg
+    return {'in_kg': in_kg, 'in_amount': in_amount, 'out_kg': out_kg, 'out_amount': out_amount,
+            'remaining': remaining, 'avg_cost': cost, 'stock_value': remaining * cost,
+            'margin': out_amount - out_kg * cost}
+
+
+def branch_labels(roots):
+    """ชื่อสาขาสำหรับรายงาน: ชื่อโฟลเดอร์ท้ายสุด เพิ่มโฟลเดอร์แม่จนกว่าจะไม่ซ้ำกัน"""
+    parts = [os.path.abspath(root).split(os.sep) for root in roots]
+    depth = 1
+    while True:
+        labels = ['/'.join(p[-depth:]) or root for p, root in zip(parts, roots)]
+        if len(set(labels)) == len(labels) or depth >= max(len(p) for p in parts):
+            return labels
+        depth += 1
+
+
+def consolidate_branches(roots, workers=None, cache_file=CONSOLIDATION_CACHE_FILE):
+    """รวมยอดรายสินค้าและรายสาขาจากโฟลเดอร์ข้อมูลหลายสาขา
+
+    อ่านแต่ละสาขาใน process แยกกัน และเก็บยอดย่อยของแต่ละสาขาไว้ใน cache ตาม fingerprint
+    ของไฟล์ จึงอ่านใหม่เฉพาะสาขาที่ไฟล์เปลี่ยน
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        cache = {}
+
+    # โฟลเดอร์เดียวกันที่ส่งมาซ้ำนับเพียงครั้งเดียว
+    seen, unique = set(), []
+    for root in roots:
+        if os.path.abspath(root) not in seen:
+            seen.add(os.path.abspath(root))
+            unique.append(root)
+    roots = unique
+    # โฟลเดอร์ที่พิมพ์ผิดหรือส่งโฟลเดอร์ data มาเองจะไม่มีสมุดบัญชี ห้ามนับเป็นสาขาที่ยอดเป็นศูนย์
+    for root in roots:
+        if not any(os.path.exists(os.path.join(root, path)) for path in LEDGER_FILES.values()):
+            raise FileNotFoundError(
+                f"ไม่พบสมุดบัญชีของสาขาใน {root} (ต้องมี {' หรือ '.join(LEDGER_FILES.values())})")
+
+    branches, stale = {}, []
+    for root in roots:
+        key = os.path.abspath(root)
+        cached = cache.get(key)
+        if cached and all(fingerprint_matches(path, cached['fingerprints'].get(path))
+                          for path in _branch_sources(root)):
+            branches[root] = cached
+        else:
+            stale.append(root)
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers or len(stale)) as pool:
+            futures = {root: pool.submit(aggregate_branch, root) for root in stale}
+            for root, future in futures.items():
+                branches[root] = cache[os.path.abspath(root)] = future.result()
+        try:
+            os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+            tmp_file = f"{cache_file}.tmp"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"⚠️ ไม่สามารถบันทึก cache การรวมยอดได้: {e}")
+    print(f"🏢 คำนวณใหม่ {len(stale)} จาก {len(roots)} สาขา")
+
+    report = {'branches': {}, 'items': {}}
+    for root, name in zip(roots, branch_labels(roots)):
+        data = branches[root]
+        per_item = {item: _item_figures(values, data['buy_prices'].get(item))
+                    for item, values in data['items'].items()}
+        report['branches'][name] = per_item
+        for item, figures in per_item.items():
+            total = report['items'].setdefault(item, dict.fromkeys(figures, 0.0))
+            for field, value in figures.items():
+                total[field] += value
+    for total in report['items'].values():
+        # ต้นทุนเฉลี่ยรวมถ่วงน้ำหนักด้วย กก. ที่รับซื้อ ไม่ใช่ผลรวมของแต่ละสาขา
+        total['avg_cost'] = total['in_amount'] / total['in_kg'] if total['in_kg'] else 0.0
+    return report
+
+
+def print_consolidation_report(report):
+    def line(label, figures):
+        print(f"   - {label}: คงคลัง {figures['remaining']:,.2f} กก. "
+              f"(มูลค่า {figures['stock_value']:,.2f} บาท) | "
+              f"รับ {figures['in_kg']:,.2f} กก. {figures['in_amount']:,.2f} บาท | "
+              f"ขาย {figures['out_kg']:,.2f} กก. {figures['out_amount']:,.2f} บาท | "
+              f"กำไร {figures['margin']:,.2f} บาท")
+
+    print("🏢 === ยอดรวมทุกสาขา ===")
+    for name, per_item in report['branches'].items():
+        totals = {field: sum(f[field] for f in per_item.values())
+                  for field in ('remaining', 'stock_value', 'in_kg', 'in_amount',
+                                'out_kg', 'out_amount', 'margin')}
+        line(f"สาขา {name}", totals)
+    print("📦 รายสินค้า:")
+    for item, figures in sorted(report['items'].items()):
+        line(item, figures)
+        for name, per_item in report['branches'].items():
+            if item in per_item:
+                print(f"        {name}: คงคลัง {per_item[item]['remaining']:,.2f} กก. "
+                      f"กำไร {per_item[item]['margin']:,.2f} บาท")
+
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="โปรแกรมคำนวณรับซื้อและจำหน่ายของเก่า")
+    parser.add_argument('--reconcile', action='store_true',
+                        help="ตรวจสอบความสอดคล้องของ Excel, ประวัติใบเสร็จ และไฟล์ PDF")
+    parser.add_argument('--repair', action='store_true',
+                        help="ใช้กับ --reconcile เพื่อซ่อมข้อมูลที่ไม่สอดคล้อง")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="จำนวน process สำหรับงานที่ทำแบบขนาน")
+    parser.add_argument('--loadtest', action='store_true',
+                        help="ทดสอบโหลดขั้นตอนบันทึกรายการแบบไม่มีหน้าจอ")
+    parser.add_argument('--tps', type=float, default=2.0,
+                        help="ใช้กับ --loadtest: จำนวนรายการต่อวินาที")
+    parser.add_argument('--count', type=int, default=1000,
+                        help="ใช้กับ --loadtest: จำนวนรายการทั้งหมด")
+    parser.add_argument('--days', type=int, default=365,
+                        help="ใช้กับ --loadtest: จำนวนวันที่จำลองให้ข้อมูลสะสม")
+    parser.add_argument('--no-pdf', action='store_true',
+                        help="ใช้กับ --loadtest: ไม่สร้างไฟล์ PDF")
+    parser.add_argument('--workdir', default=None,
+                        help="ใช้กับ --loadtest: โฟลเดอร์สำหรับข้อมูลทดสอบ")
+    parser.add_argument('--archive', action='store_true',
+                        help="ย้ายข้อมูลเดือนที่ปิดแล้วไปเก็บถาวรแบบบีบอัด")
+    parser.add_argument('--keep-months', type=int, default=12,
+                        help="ใช้กับ --archive: จำนวนเดือนล่าสุดที่เก็บไว้ในไฟล์ที่ใช้งาน")
+    parser.add_argument('--report', nargs=2, metavar=('FROM', 'TO'),
+                        help="รายงานยอดรายสินค้าช่วงวันที่ dd/mm/YYYY ถึง dd/mm/YYYY (รวมวันสุดท้าย)")
+    parser.add_argument('--item', default=None,
+                        help="ใช้กับ --report: แสดงทีละรายการของสินค้านี้ (รวมข้อมูลที่เก็บถาวร)")
+    parser.add_argument('--consolidate', nargs='+', metavar='ROOT',
+                        help="รวมยอดคงคลัง ปริมาณ และกำไรจากโฟลเดอร์ข้อมูลของหลายสาขา")
+    parser.add_argument('--backup', metavar='TARGET',
+                        help="สำรองข้อมูลและใบเสร็จแบบเพิ่มเฉพาะส่วนที่เปลี่ยนไปที่โฟลเดอร์ TARGET")
+    parser.add_argument('--list-backups', metavar='TARGET',
+                        help="แสดงรายการ snapshot ในโฟลเดอร์สำรอง")
+    parser.add_argument('--restore', nargs='+', metavar='ARG',
+                        help="TARGET SNAPSHOT [DEST] กู้คืนข้อมูลให้ตรงกับ snapshot (ค่าเริ่มต้น DEST คือโฟลเดอร์ปัจจุบัน) "
+                             "ไฟล์ที่ไม่มีใน snapshot จะถูกย้ายไปที่ restore_quarantine/SNAPSHOT")
+    args = parser.parse_args()
+
+    if args.backup:
+        name, stats = BackupStore(args.backup).backup()
+        print(f"💾 สร้าง snapshot {name}: {stats['files']} ไฟล์ "
+              f"(เปลี่ยน {stats['changed']}, เขียนใหม่ {stats['bytes']:,} bytes)")
+        sys.exit(0)
+
+    if args.list_backups:
+        store = BackupStore(args.list_backups)
+        for name in store.snapshots():
+            manifest = store.manifest(name)
+            print(f"   - {name} ({manifest['created']}, {len(manifest['files'])} ไฟล์)")
+        sys.exit(0)
+
+    if args.restore:
+        if len(args.restore) not in (2, 3):
+            parser.error("--restore ต้องระบุ TARGET SNAPSHOT [DEST]")
+        dest = args.restore[2] if len(args.restore) == 3 else '.'
+        try:
+            restored, quarantined = BackupStore(args.restore[0]).restore(args.restore[1], dest)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ กู้คืน snapshot {args.restore[1]} ไปที่ {dest}: เขียน {restored} ไฟล์")
+        if quarantined:
+            print(f"📦 ย้ายไฟล์ที่ไม่มีใน snapshot {quarantined} ไฟล์ไปที่ "
+                  f"{os.path.join(dest, BACKUP_QUARANTINE_DIR, args.restore[1])}")
+        sys.exit(0)
+
+    if args.consolidate:
+        try:
+            report = consolidate_branches(args.consolidate, workers=args.workers)
+        except FileNotFoundError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print_consolidation_report(report)
+        sys.exit(0)
+
+    if args.archive:
+        try:
+            archive_closed_periods(keep_months=args.keep_months)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.report:
+        start = datetime.strptime(args.report[0], '%d/%m/%Y')
+        end = datetime.strptime(args.report[1], '%d/%m/%Y') + timedelta(days=1)
+        print_period_report(period_report('.', start, end), start, end - timedelta(days=1))
+        if args.item:
+            print(f"🧾 === รายการของ {args.item} ===")
+            print_period_transactions(period_transactions('.', start, end, args.item))
+        sys.exit(0)
+
+    if args.loadtest:
+        run_load_test(tps=args.tps, count=args.count, days=args.days,
+                      workdir=args.workdir, render_pdf=not args.no_pdf)
+        sys.exit(0)
+
+    if args.reconcile:
+        try:
+            report = reconcile(repair=args.repair, workers=args.workers)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print_reconcile_report(report)
+        sys.exit(0)
+
     # เรียกใช้ฟังก์ชันดีบักก่อนเริ่มโปรแกรม
     debug_prices_file()
 
     print("🚀 เริ่มต้นโปรแกรม...")
+    # ถือล็อกไว้ตลอดที่เปิดโปรแกรม ไม่ให้ --archive เขียน Excel ใหม่ทับรายการที่กำลังบันทึก
+    data_lock = DataLock()
+    try:
+        data_lock.acquire()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        messagebox.showerror("ไม่สามารถเปิดโปรแกรมได้", str(e))
+        sys.exit(1)
     root = ctk.CTk()
     app = ScrapShopApp(root)
     root.mainloop()